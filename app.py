@@ -1,26 +1,84 @@
 
+import json
+import os
+import tempfile
 import streamlit as st
 import pandas as pd
+from datetime import date, timedelta
 from urllib.parse import quote_plus
-from db import init_db, insert_contact, update_contact, delete_contact, fetch_contacts, insert_order, fetch_orders, insert_campaign, fetch_campaigns, insert_activity, fetch_activities, kpis
+from db import CONTACT_FIELDS, init_db, insert_contact, update_contact, delete_contact, fetch_contacts, fetch_contacts_page, count_contacts, insert_order, fetch_orders_page, count_orders, insert_campaign, fetch_campaigns_page, count_campaigns, insert_activity, kpis, kpi_series, cache_info, find_unfinished_import, normalize_phone, duplicate_stats, merge_duplicates, fetch_contact, fetch_timeline, count_timeline, contact_facets, configure_profiling, profile_settings, start_profile_scope, merge_profile, new_profile, profile_report, profile_snapshot, reset_profile, slow_queries, fetch_job, fetch_jobs, cancel_job, JOB_ACTIVE, bulk_update_contacts, fetch_bulk_updates
+from importer import read_preview, guess_mapping, fingerprint
+from exporter import EXPORT_COLUMNS
+from jobs import EXPORT_FORMATS, submit_import, submit_export, submit_bulk_update, resume_job, clear_jobs, recover_jobs
+from whatsapp import TEMPLATE_FIELDS, render_segment, run_campaign
 
 st.set_page_config(page_title="Vanto CRM", page_icon="📇", layout="wide")
 
 # --- INIT DB ---
 init_db()
+recover_jobs()   # jobs left queued/running by a previous run of the app become resumable
+# CRM_PROFILE=1 starts with query profiling on; the Diagnostics page can also switch it
+if os.environ.get("CRM_PROFILE") and "profiling_from_env" not in st.session_state:
+    st.session_state["profiling_from_env"] = True
+    configure_profiling(enabled=True)
+rerun_profile = start_profile_scope()
 
 # --- SIDEBAR NAV ---
 st.sidebar.title("📇 Vanto CRM")
-page = st.sidebar.radio("Navigate", ["Dashboard","Contacts","Orders","Campaigns","WhatsApp Tools","Import / Export","Help"])
+PAGES = ["Dashboard","Contacts","Contact Detail","Orders","Campaigns","WhatsApp Tools","Import / Export","Help"]
+if "diagnostics" in st.query_params:  # hidden page: open the app with ?diagnostics=1
+    PAGES.append("Diagnostics")
+page = st.sidebar.radio("Navigate", PAGES)
 
 # --- HELPERS ---
 def wa_link(phone: str, text: str):
-    p = "".join([c for c in phone if c.isdigit()])
-    if p.startswith("0"):
-        p = "27" + p[1:]
+    p = normalize_phone(phone)
     encoded = quote_plus(text)
     return f"https://wa.me/{p}?text={encoded}"
 
+def paged_table(key: str, fetch_page, count, columns: list, filters: tuple = (), selectable: bool = False):
+    # Shows one page of a table; only that page is fetched. fetch_page(limit=, after=) -> (rows, next_cursor).
+    # The cursors of the pages visited so far are kept in session_state so Prev can step back;
+    # changing the filters or the page size starts again from page 1.
+    # selectable=True lets rows be ticked; the ticked rows of this page are in session_state[f"{key}_selected"].
+    size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1, key=f"{key}_size")
+    state = st.session_state.setdefault(f"{key}_pager", {"filters": None, "cursors": [None]})
+    if state["filters"] != (filters, size):
+        state["filters"], state["cursors"] = (filters, size), [None]
+    rows, next_cursor = fetch_page(limit=size, after=state["cursors"][-1])
+    picked = []
+    if rows:
+        # keyed on the page, so ticks don't carry over to other rows when paging or filtering
+        event = st.dataframe(pd.DataFrame(rows, columns=columns), use_container_width=True, hide_index=True,
+                             key=f"{key}_table_{hash((filters, size, len(state['cursors'])))}" if selectable else None,
+                             on_select="rerun" if selectable else "ignore", selection_mode="multi-row")
+        if selectable:
+            picked = [rows[i] for i in event.selection.rows if i < len(rows)]
+    st.session_state[f"{key}_selected"] = picked
+    total = count()
+    c1, c2, c3 = st.columns([1, 1, 6])
+    if c1.button("◀ Prev", key=f"{key}_prev", disabled=len(state["cursors"]) == 1):
+        state["cursors"].pop()
+        st.rerun()
+    if c2.button("Next ▶", key=f"{key}_next", disabled=next_cursor is None):
+        state["cursors"].append(next_cursor)
+        st.rerun()
+    c3.caption(f"Page {len(state['cursors'])} of {max(-(-total // size), 1)} • {total} rows")
+    return rows
+
+BULK_INLINE_MAX = 5000   # bulk edits of more contacts than this run as a background job
+JOBS_SHOWN = 10
+JOBS_POLL_SECONDS = 1.5
+
+def job_summary(job: dict) -> str:
+    # "12,000 / 40,000 rows • 3,150 rows/s • 3.8s"
+    parts = [f"{job['done']:,}" + (f" / {job['total']:,}" if job["total"] is not None else "") + " rows"]
+    if job["rate"]:
+        parts.append(f"{job['rate']:,.0f} rows/s")
+    if job["seconds"]:
+        parts.append(f"{job['seconds']:.1f}s")
+    return " • ".join(parts)
+
 STATUSES = ["New","Warm","Hot","Customer","Inactive"]
 
 # --- DASHBOARD ---
@@ -33,6 +91,23 @@ if page == "Dashboard":
     c3.metric("🔥 Hot Leads", m["hot"])
     c4.metric("Orders", m["orders"])
     c5.metric("Revenue (Paid/Shipped/Delivered)", f"R{m['revenue']:.2f}")
+    span = st.selectbox("Chart range", [30, 90, 365], index=1, format_func=lambda d: f"Last {d} days")
+    revenue, signups = kpi_series(since=(date.today() - timedelta(days=span)).isoformat())
+    g1, g2 = st.columns(2)
+    with g1:
+        st.subheader("Revenue by day")
+        if revenue:
+            st.bar_chart(pd.DataFrame(revenue, columns=["Day","Orders","Revenue"]).set_index("Day")["Revenue"])
+        else:
+            st.caption("No orders in this range.")
+    with g2:
+        st.subheader("Conversion by signup day")
+        if signups:
+            s_df = pd.DataFrame(signups, columns=["Day","Contacts","Customers"]).set_index("Day")
+            s_df["Conversion %"] = (s_df["Customers"] / s_df["Contacts"].where(s_df["Contacts"] > 0) * 100).round(1)
+            st.line_chart(s_df["Conversion %"])
+        else:
+            st.caption("No new contacts in this range.")
     st.info("Tip: Import your Excel/CSV via **Import / Export** to populate this dashboard.")
 
 # --- CONTACTS ---
@@ -71,69 +146,159 @@ elif page == "Contacts":
                     ))
                     st.success(f"Saved contact #{contact_id}: {name}")
         elif mode == "Edit":
-            rows = fetch_contacts()
-            options = {f"#{r[0]} {r[1]} • {r[2] or ''}": r for r in rows}
+            rows = fetch_contacts(columns=("id","name","phone"))
+            options = {f"#{r.id} {r.name} • {r.phone or ''}": r.id for r in rows}
             sel = st.selectbox("Select contact", list(options.keys())) if options else None
-            if sel:
-                r = options[sel]
+            r = fetch_contact(options[sel]) if sel else None
+            if r:
                 with st.form("edit_contact"):
-                    name = st.text_input("Name *", r[1])
-                    phone = st.text_input("Phone", r[2] or "")
-                    email = st.text_input("Email", r[3] or "")
+                    name = st.text_input("Name *", r.name)
+                    phone = st.text_input("Phone", r.phone or "")
+                    email = st.text_input("Email", r.email or "")
                     c1, c2, c3 = st.columns(3)
                     with c1:
-                        source = st.text_input("Source", r[4] or "")
+                        source = st.text_input("Source", r.source or "")
                     with c2:
-                        interest = st.text_input("Interest", r[5] or "")
+                        interest = st.text_input("Interest", r.interest or "")
                     with c3:
-                        status = st.selectbox("Status", STATUSES, index=STATUSES.index(r[6] or "New"))
+                        status = st.selectbox("Status", STATUSES, index=STATUSES.index(r.status or "New"))
                     c4, c5 = st.columns(2)
                     with c4:
-                        tags = st.text_input("Tags", r[7] or "")
-                        username = st.text_input("Username", r[12] or "")
-                        password = st.text_input("Password", r[13] or "")
+                        tags = st.text_input("Tags", r.tags or "")
+                        username = st.text_input("Username", r.username or "")
+                        password = st.text_input("Password", r.password or "")
                     with c5:
-                        assigned = st.text_input("Assigned", r[8] or "")
-                        action_needed = st.text_area("Action Needed", r[10] or "", height=80)
-                        action_taken = st.text_area("Action Taken", r[11] or "", height=80)
-                    notes = st.text_area("Notes", r[9] or "", height=80)
+                        assigned = st.text_input("Assigned", r.assigned or "")
+                        action_needed = st.text_area("Action Needed", r.action_needed or "", height=80)
+                        action_taken = st.text_area("Action Taken", r.action_taken or "", height=80)
+                    notes = st.text_area("Notes", r.notes or "", height=80)
                     submitted = st.form_submit_button("Update Contact")
                     if submitted and name:
-                        update_contact(r[0], dict(
+                        update_contact(r.id, dict(
                             name=name, phone=phone, email=email, source=source, interest=interest, status=status,
                             tags=tags, assigned=assigned, notes=notes, action_needed=action_needed, action_taken=action_taken,
                             username=username, password=password
                         ))
                         st.success("Contact updated.")
         else:  # Delete
-            rows = fetch_contacts()
-            options = {f"#{r[0]} {r[1]} • {r[2] or ''}": r for r in rows}
+            rows = fetch_contacts(columns=("id","name","phone"))
+            options = {f"#{r.id} {r.name} • {r.phone or ''}": r for r in rows}
             sel = st.selectbox("Select contact to delete", list(options.keys())) if options else None
             if sel and st.button("Delete Contact", type="primary"):
                 r = options[sel]
-                delete_contact(r[0])
-                st.warning(f"Deleted contact #{r[0]} {r[1]}")
+                delete_contact(r.id)
+                st.warning(f"Deleted contact #{r.id} {r.name}")
 
     st.subheader("Search & Filter")
-    col1, col2, col3 = st.columns(3)
+    # facet counts come first, from the filter values already in session state, so every option
+    # below shows how many contacts picking it would give alongside the other filters
+    tags_sel = st.session_state.get("c_tags", [])
+    tag_mode = "any" if st.session_state.get("c_tag_mode") == "Any" else "all"
+    facets = contact_facets(st.session_state.get("c_search", ""), st.session_state.get("c_status", ""), ",".join(tags_sel), tag_mode)
+    status_counts, tag_counts = dict(facets["statuses"]), dict(facets["tags"])
+    col1, col2 = st.columns([2, 1])
     with col1:
-        search = st.text_input("Search", placeholder="Name, phone, email, interest, notes, action...")
+        search = st.text_input("Search", key="c_search", placeholder="Name, phone, email, interest, notes, action...")
     with col2:
-        status_f = st.selectbox("Status filter", [""] + STATUSES)
-    with col3:
-        tag_f = st.text_input("Tag filter")
-    rows = fetch_contacts(search=search, status=status_f, tag=tag_f)
-    if rows:
-        df = pd.DataFrame(rows, columns=["ID","Name","Phone","Email","Source","Interest","Status","Tags","Assigned","Notes","ActionNeeded","ActionTaken","Username","Password","Created"])
-        st.dataframe(df, use_container_width=True, hide_index=True)
-    else:
+        status_f = st.selectbox("Status filter", [""] + STATUSES, key="c_status",
+                                format_func=lambda s: f"{s or 'Any status'} ({status_counts.get(s, 0) if s else sum(status_counts.values())})")
+    st.sidebar.subheader("Tags")
+    tags_sel = st.sidebar.multiselect("Tags", [t for t, _ in facets["tags"]] + [t for t in tags_sel if t not in tag_counts],
+                                      key="c_tags", format_func=lambda t: f"{t} ({tag_counts.get(t, 0)})", label_visibility="collapsed")
+    tag_mode = "any" if st.sidebar.radio("Match", ["All", "Any"], key="c_tag_mode", horizontal=True,
+                                         help="All: contacts with every selected tag. Any: with at least one.") == "Any" else "all"
+    tag_f = ",".join(tags_sel)
+    rows = paged_table(
+        "contacts",
+        lambda limit, after: fetch_contacts_page(search=search, status=status_f, tag=tag_f, limit=limit, after=after, tag_mode=tag_mode),
+        lambda: count_contacts(search=search, status=status_f, tag=tag_f, tag_mode=tag_mode),
+        ["ID","Name","Phone","Email","Source","Interest","Status","Tags","Assigned","Notes","ActionNeeded","ActionTaken","Username","Password","Created"],
+        filters=(search, status_f, tag_f, tag_mode),
+        selectable=True,
+    )
+    if not rows:
         st.info("No contacts found.")
+    with st.expander("✏️ Bulk edit"):
+        # one UPDATE for the whole set; fields left blank are not touched
+        picked = st.session_state.get("contacts_selected", [])
+        total = count_contacts(search=search, status=status_f, tag=tag_f, tag_mode=tag_mode)
+        targets = [f"Ticked rows ({len(picked)})", f"All {total:,} contacts matching the filters"]
+        target = st.radio("Apply to", targets, index=0 if picked else 1, horizontal=True, key="bulk_target")
+        with st.form("bulk_edit"):
+            b1, b2, b3 = st.columns(3)
+            with b1:
+                new_status = st.selectbox("Status", [""] + STATUSES, format_func=lambda s: s or "(unchanged)")
+            with b2:
+                new_assigned = st.text_input("Assigned", placeholder="(unchanged)")
+            with b3:
+                new_tags = st.text_input("Tags", placeholder="(unchanged) — replaces the existing tags")
+            new_action = st.text_input("Action Needed", placeholder="(unchanged)")
+            apply = st.form_submit_button("Apply to contacts")
+        if apply:
+            changes = {k: v.strip() for k, v in dict(status=new_status, assigned=new_assigned, tags=new_tags,
+                                                     action_needed=new_action).items() if v.strip()}
+            ids = [r.id for r in picked] if target == targets[0] else None
+            filters = dict(search=search, status=status_f, tag=tag_f, tag_mode=tag_mode)
+            if not changes:
+                st.warning("Fill in at least one field to change.")
+            elif ids == []:
+                st.warning("Tick some rows in the table first, or apply to all matching contacts.")
+            elif ids is None and total > BULK_INLINE_MAX:
+                job_id = submit_bulk_update(changes, **filters)
+                st.success(f"Updating {total:,} contacts in the background as job #{job_id} (progress under Import / Export → Jobs).")
+            else:
+                res = bulk_update_contacts(changes, ids=ids, **filters)
+                st.success(f"Updated {res['updated']} of {res['matched']} contacts.")
+        recent = fetch_bulk_updates(limit=5)
+        if recent:
+            st.caption("Recent bulk edits")
+            st.dataframe(pd.DataFrame([(r.activity_date, r.summary) for r in recent], columns=["When", "Change"]),
+                         use_container_width=True, hide_index=True)
+
+# --- CONTACT DETAIL ---
+elif page == "Contact Detail":
+    st.header("🗂️ Contact Detail")
+    # only the chosen contact and one page of its history are loaded, never the whole table
+    q = st.text_input("Find contact", placeholder="Name, phone, email... or #ID").strip()
+    contact_id = None
+    if q.lstrip("#").isdigit():
+        contact_id = int(q.lstrip("#"))
+    elif q:
+        matches, _ = fetch_contacts_page(search=q, limit=20, columns=("id","name","phone"))
+        if matches:
+            options = {f"#{r.id} {r.name} • {r.phone or ''}": r.id for r in matches}
+            contact_id = options[st.selectbox("Matches", list(options.keys()))]
+        else:
+            st.info("No matching contacts.")
+    r = fetch_contact(contact_id) if contact_id else None
+    if contact_id and not r:
+        st.warning(f"No contact #{contact_id}.")
+    if r:
+        st.subheader(f"#{r.id} {r.name}")
+        d1, d2, d3 = st.columns(3)
+        with d1:
+            st.markdown(f"**Status:** {r.status or '—'}  \n**Phone:** {r.phone or '—'}  \n**Email:** {r.email or '—'}")
+        with d2:
+            st.markdown(f"**Source:** {r.source or '—'}  \n**Interest:** {r.interest or '—'}  \n**Tags:** {r.tags or '—'}")
+        with d3:
+            st.markdown(f"**Assigned:** {r.assigned or '—'}  \n**Username:** {r.username or '—'}  \n**Created:** {r.created_at or '—'}")
+        if r.action_needed or r.action_taken or r.notes:
+            st.markdown(f"**Action needed:** {r.action_needed or '—'}  \n**Action taken:** {r.action_taken or '—'}  \n**Notes:** {r.notes or '—'}")
+        st.subheader("Timeline")
+        t_rows = paged_table(
+            f"timeline_{r.id}",
+            lambda limit, after: (lambda res: ([t[1:] for t in res[0]], res[1]))(fetch_timeline(r.id, limit=limit, after=after)),
+            lambda: count_timeline(r.id),
+            ["ID","When","Kind","Title","Summary","Details","Amount"],
+        )
+        if not t_rows:
+            st.info("Nothing logged for this contact yet.")
 
 # --- ORDERS ---
 elif page == "Orders":
     st.header("🧾 Orders")
-    rows = fetch_contacts()
-    contact_map = {f"#{r[0]} {r[1]}": r[0] for r in rows}
+    rows = fetch_contacts(columns=("id","name"))
+    contact_map = {f"#{r.id} {r.name}": r.id for r in rows}
     with st.form("add_order"):
         contact_sel = st.selectbox("Contact", list(contact_map.keys())) if contact_map else None
         product = st.text_input("Product (e.g., STP, NRM, Luna)")
@@ -148,11 +313,8 @@ elif page == "Orders":
             st.success("Order added.")
 
     st.subheader("Recent Orders")
-    o_rows = fetch_orders()
-    if o_rows:
-        o_df = pd.DataFrame(o_rows, columns=["ID","ContactID","Contact","Product","Qty","Amount","Status","POP","Notes","Created"])
-        st.dataframe(o_df, use_container_width=True, hide_index=True)
-    else:
+    o_rows = paged_table("orders", fetch_orders_page, count_orders, ["ID","ContactID","Contact","Product","Qty","Amount","Status","POP","Notes","Created"])
+    if not o_rows:
         st.info("No orders yet.")
 
 # --- CAMPAIGNS ---
@@ -172,11 +334,14 @@ elif page == "Campaigns":
 
     st.subheader("Search")
     s = st.text_input("Search campaigns")
-    c_rows = fetch_campaigns(s)
-    if c_rows:
-        c_df = pd.DataFrame(c_rows, columns=["ID","Date","Channel","Name","Audience","Message","Outcome","Notes"])
-        st.dataframe(c_df, use_container_width=True, hide_index=True)
-    else:
+    c_rows = paged_table(
+        "campaigns",
+        lambda limit, after: fetch_campaigns_page(s, limit=limit, after=after),
+        lambda: count_campaigns(s),
+        ["ID","Date","Channel","Name","Audience","Message","Outcome","Notes"],
+        filters=(s,),
+    )
+    if not c_rows:
         st.info("No campaigns yet.")
 
 # --- WHATSAPP TOOLS ---
@@ -188,74 +353,160 @@ elif page == "WhatsApp Tools":
                                                "Life has seasons — your door to APLGO is open again! 🔑\n"
                                                "Rejoin here 👉 https://myaplworld.com/pages.cfm?p=CC1809B8\n"
                                                "We’ve kept your seat warm 🔥"))
-    rows = fetch_contacts()
+    rows = fetch_contacts(columns=("id","name"))
     if rows:
         st.subheader("Pick a contact")
-        lookup = {f"#{r[0]} {r[1]}": r for r in rows}
+        lookup = {f"#{r.id} {r.name}": r.id for r in rows}
         sel = st.selectbox("Contact", list(lookup.keys()))
-        r = lookup[sel]
-        filled = template.format(
-            name=r[1], phone=r[2] or "", interest=r[5] or "", status=r[6] or "", tags=r[7] or "", assigned=r[8] or "",
-            action_needed=r[10] or "", action_taken=r[11] or "", username=r[12] or "", password=r[13] or ""
-        )
-        link = wa_link(r[2] or "", filled)
+        r = fetch_contact(lookup[sel], columns=("id", *TEMPLATE_FIELDS))
+        filled = template.format(**{f: getattr(r, f) or "" for f in TEMPLATE_FIELDS})
+        link = wa_link(r.phone or "", filled)
         st.markdown(f"[Open WhatsApp message ↗]({link})")
         st.code(filled)
         if st.button("Log as Activity (WhatsApp)"):
-            insert_activity(dict(contact_id=r[0], activity_date=None, type="whatsapp", summary="Sent template", details=filled))
+            insert_activity(dict(contact_id=r.id, activity_date=None, type="whatsapp", summary="Sent template", details=filled))
             st.success("Activity logged.")
     else:
         st.info("Add contacts first.")
 
+    st.divider()
+    st.subheader("Batch campaign")
+    st.write("Send the template above to a whole segment: download the message queue and log every send in one go.")
+    b1, b2, b3 = st.columns(3)
+    with b1:
+        b_search = st.text_input("Search", key="wa_search", placeholder="Same as the Contacts page search")
+    with b2:
+        b_status = st.selectbox("Status filter", [""] + STATUSES, key="wa_status")
+    with b3:
+        b_tag = st.text_input("Tags", key="wa_tag", placeholder="Comma-separated, all must match")
+    b_filters = dict(search=b_search, status=b_status, tag=b_tag)
+    st.caption(f"{count_contacts(**b_filters)} contacts in this segment.")
+    try:
+        sample = next(render_segment(template, chunk_size=5, **b_filters), None)
+    except ValueError as e:
+        st.error(str(e))
+        sample = None
+    if sample is not None:
+        st.dataframe(sample[["contact_id","name","wa_phone","message"]], use_container_width=True, hide_index=True)
+        campaign_name = st.text_input("Campaign name", key="wa_campaign")
+        log_it = st.checkbox("Log a campaign and one WhatsApp activity per contact", value=True)
+        if st.button("Generate queue", type="primary"):
+            prev = st.session_state.pop("wa_queue_file", None)
+            if prev and os.path.exists(prev):
+                os.remove(prev)
+            audience = ", ".join(f"{k}={v}" for k, v in b_filters.items() if v) or "All contacts"
+            with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="", encoding="utf-8") as tmp:
+                res = run_campaign(template, dict(channel="WhatsApp", name=campaign_name, audience=audience, outcome="Sent"),
+                                   out=tmp, log=log_it, **b_filters)
+            st.session_state["wa_queue_file"] = tmp.name
+            st.success(f"Rendered {res['rendered']} messages" + (f", logged campaign #{res['campaign_id']}." if log_it else "."))
+        queue_file = st.session_state.get("wa_queue_file")
+        if queue_file and os.path.exists(queue_file):
+            with open(queue_file, "rb") as fh:
+                st.download_button("Download queue CSV", fh, "whatsapp_queue.csv", "text/csv")
+
 # --- IMPORT / EXPORT ---
 elif page == "Import / Export":
     st.header("📥 Import / Export")
     st.write("Import contacts from CSV/Excel. Map fields below. New fields supported: ActionNeeded, ActionTaken, Username, Password")
     upl = st.file_uploader("Upload CSV or Excel", type=["csv","xlsx"])
     if upl is not None:
-        if upl.name.endswith(".csv"):
-            df = pd.read_csv(upl)
-        else:
-            df = pd.read_excel(upl)
+        # only the header and a few rows are read here; the import itself streams the file in chunks
+        preview = read_preview(upl, upl.name)
         st.write("Preview:")
-        st.dataframe(df.head(), use_container_width=True)
-        # Map columns
-        default_map = {
-            "name":"name","phone":"phone","email":"email","source":"source","interest":"interest",
-            "status":"status","tags":"tags","assigned":"assigned","notes":"notes",
-            "action_needed":"action_needed","action_taken":"action_taken","username":"username","password":"password"
-        }
+        st.dataframe(preview, use_container_width=True)
+        unfinished = find_unfinished_import(fingerprint(upl))
+        if unfinished:
+            st.info(f"An earlier import of this file stopped after {unfinished['rows_done']} rows. "
+                    "Importing with the same mapping continues from there.")
+        guess = json.loads(unfinished["col_map"]) if unfinished else guess_mapping(preview.columns)
         st.write("Map your columns to CRM fields:")
-        crm_fields = list(default_map.keys())
         col_map = {}
-        for f in crm_fields:
-            options = ["--"] + list(df.columns)
-            # auto-guess
-            guess = next((c for c in df.columns if c.lower().strip().replace(" ","") == f.replace("_","")), None)
-            col_map[f] = st.selectbox(f"{f}", options, index=(options.index(guess) if guess in options else 0), key=f"map_{f}")
+        for f in CONTACT_FIELDS:
+            options = ["--"] + list(preview.columns)
+            col_map[f] = st.selectbox(f"{f}", options, index=(options.index(guess[f]) if guess.get(f) in options else 0), key=f"map_{f}")
+        imp_mode = st.radio("Existing contacts", ["Update matches (same phone or email), add the rest", "Add every row as a new contact"])
         if st.button("Import Now", type="primary"):
-            cnt = 0
-            for _, row in df.iterrows():
-                data = {}
-                for f, col in col_map.items():
-                    if col != "--":
-                        val = row[col]
-                        if pd.isna(val):
-                            val = ""
-                        data[f] = str(val)
-                    else:
-                        data[f] = ""
-                if data.get("name") or data.get("phone"):
-                    insert_contact(data)
-                    cnt += 1
-            st.success(f"Imported {cnt} contacts.")
+            job_id = submit_import(upl, upl.name, col_map, upsert=imp_mode.startswith("Update"))
+            st.success(f"Import started as job #{job_id} — it keeps running if you leave this page. Progress is under Jobs below.")
+    with st.expander("🧹 Merge duplicate contacts"):
+        dups = duplicate_stats()
+        st.write(f"{dups['phone']} contacts share a phone number and {dups['email']} share an email with an older contact.")
+        st.caption("Merging keeps the oldest contact, fills its empty fields from the duplicates and moves their orders and activities over.")
+        if st.button("Merge duplicates", disabled=not (dups["phone"] or dups["email"])):
+            st.success(f"Merged {merge_duplicates()['merged']} duplicate contacts.")
     st.divider()
     st.subheader("Export")
-    exp_rows = fetch_contacts()
-    if exp_rows:
-        cols = ["ID","Name","Phone","Email","Source","Interest","Status","Tags","Assigned","Notes","ActionNeeded","ActionTaken","Username","Password","Created"]
-        exp_df = pd.DataFrame(exp_rows, columns=cols)
-        st.download_button("Download Contacts CSV", exp_df.to_csv(index=False).encode("utf-8"), "contacts_export.csv", "text/csv")
+    e1, e2 = st.columns(2)
+    with e1:
+        kind = st.selectbox("Table", list(EXPORT_COLUMNS), format_func=str.title)
+    with e2:
+        fmt = st.selectbox("Format", list(EXPORT_FORMATS))
+    filters = {}
+    if kind == "contacts":
+        f1, f2, f3 = st.columns(3)
+        with f1:
+            filters["search"] = st.text_input("Search", key="exp_search", placeholder="Same as the Contacts page search")
+        with f2:
+            filters["status"] = st.selectbox("Status filter", [""] + STATUSES, key="exp_status")
+        with f3:
+            filters["tag"] = st.text_input("Tags", key="exp_tag", placeholder="Comma-separated, all must match")
+    # the file is built by a background job, streamed from the database; download it under Jobs
+    if st.button("Prepare export"):
+        job_id = submit_export(kind, fmt, **filters)
+        st.success(f"Export started as job #{job_id}.")
+    st.divider()
+    st.subheader("Jobs")
+    # a download button holds its whole file, so one is only built for the export picked with
+    # "Get file", here rather than in the polled panel below
+    picked = fetch_job(st.session_state["export_download"]) if "export_download" in st.session_state else None
+    res = (picked or {}).get("result") or {}
+    if os.path.exists(res.get("path", "")):
+        with open(res["path"], "rb") as fh:
+            st.download_button(f"Download {res['file_name']} (job #{picked['id']}, {res['bytes']:,} bytes)", fh, res["file_name"],
+                               res["mime"], type="primary", on_click=st.session_state.pop, args=("export_download", None))
+    else:
+        st.session_state.pop("export_download", None)
+    jobs_active = any(j["status"] in JOB_ACTIVE for j in fetch_jobs(limit=JOBS_SHOWN))
+
+    # polls only while a job is queued or running; when that changes (a job finished, or Resume
+    # was clicked) the whole page reruns, so polling follows and the counts above are fresh
+    @st.fragment(run_every=JOBS_POLL_SECONDS if jobs_active else None)
+    def jobs_panel():
+        jobs = fetch_jobs(limit=JOBS_SHOWN)
+        if jobs_active != any(j["status"] in JOB_ACTIVE for j in jobs):
+            st.rerun()
+        if not jobs:
+            st.caption("Imports and exports run here in the background.")
+        for j in jobs:
+            with st.container(border=True):
+                c1, c2 = st.columns([4, 1])
+                with c1:
+                    st.write(f"**#{j['id']} {j['label']}** — {j['status']}")
+                    if j["status"] in JOB_ACTIVE:
+                        st.progress(j["progress"] or 0.0, text=job_summary(j))
+                    else:
+                        st.caption(job_summary(j))
+                    if j["error"]:
+                        st.error(j["error"])
+                    res = j["result"] or {}
+                    if j["kind"] == "import" and res:
+                        st.caption(f"{res['inserted']} new contacts, {res['updated']} updated, {res['skipped']} rows skipped (no name or phone).")
+                    elif j["kind"] == "bulk_update" and res:
+                        st.caption(f"{res['updated']} of {res['matched']} matching contacts changed.")
+                with c2:
+                    if j["status"] in JOB_ACTIVE:
+                        st.button("Cancel", key=f"job_cancel_{j['id']}", on_click=cancel_job, args=(j["id"],))
+                    elif j["status"] != "done":
+                        st.button("Resume", key=f"job_resume_{j['id']}", on_click=resume_job, args=(j["id"],))
+                    elif j["kind"] == "export" and os.path.exists(res.get("path", "")):
+                        if st.button("Get file", key=f"job_file_{j['id']}"):
+                            st.session_state["export_download"] = j["id"]
+                            st.rerun()
+        if any(j["status"] not in JOB_ACTIVE for j in jobs):
+            st.button("Clear finished jobs", on_click=clear_jobs, args=(jobs,))
+
+    jobs_panel()
 
 # --- HELP ---
 elif page == "Help":
@@ -270,3 +521,64 @@ python -m streamlit run app.py
 - Use **Import / Export** to bring in your Excel lists.
 - Use **WhatsApp Tools** with placeholders like `{name}`, `{interest}`, `{action_needed}`, `{username}` in your templates.
 """)
+
+# --- DIAGNOSTICS ---
+elif page == "Diagnostics":
+    st.header("🩺 Diagnostics")
+    settings = profile_settings()
+    d1, d2, d3 = st.columns(3)
+    with d1:
+        enabled = st.toggle("Profile db calls", value=settings["enabled"])
+    with d2:
+        slow_ms = st.number_input("Slow query threshold (ms)", min_value=0.0, value=float(settings["slow_ms"]), step=10.0)
+    with d3:
+        if st.button("Reset counters"):
+            reset_profile()
+            st.session_state.pop("profile_session", None)
+            st.session_state.pop("profile_last", None)
+    if enabled != settings["enabled"] or slow_ms != settings["slow_ms"]:
+        configure_profiling(enabled=enabled, slow_ms=slow_ms)
+        st.rerun()
+    if not enabled:
+        st.info("Profiling is off. Switch it on, use the app, then come back here.")
+
+    buckets = [f"≤{b}ms" for b in settings["buckets_ms"]] + [f">{settings['buckets_ms'][-1]}ms"]
+    def profile_table(profile: dict, kind: str, top: int = 15):
+        rows = profile_report(profile, kind, top)
+        if not rows:
+            st.caption("Nothing recorded.")
+            return
+        df = pd.DataFrame([{("SQL" if kind == "sql" else "Function"): r["key"], "Calls": r["calls"], "Total ms": round(r["total_ms"], 1),
+                            "Avg ms": round(r["avg_ms"], 2), "Max ms": round(r["max_ms"], 1), "Rows": r["rows"],
+                            **dict(zip(buckets, r["hist"]))} for r in rows])
+        st.dataframe(df, use_container_width=True, hide_index=True)
+
+    snap = profile_snapshot()
+    for title, prof in [("Previous rerun", st.session_state.get("profile_last")),
+                        ("This session", st.session_state.get("profile_session")), ("Whole process", snap)]:
+        st.subheader(title)
+        if not prof:
+            st.caption("Nothing recorded.")
+            continue
+        st.caption(f"{prof['checkouts']} connection checkouts")
+        profile_table(prof, "sql")
+        profile_table(prof, "functions")
+
+    st.subheader("Connections")
+    st.dataframe(pd.DataFrame([dict(Database=k, **v) for k, v in snap["pools"].items()]), use_container_width=True, hide_index=True)
+    st.subheader(f"Slow queries (≥ {settings['slow_ms']:g} ms, newest first)")
+    if not slow_queries:
+        st.caption("None logged.")
+    for q in reversed(list(slow_queries)):
+        with st.expander(f"{q['ms']:.1f} ms • {q['rows']} rows • {q['sql'][:90]}"):
+            st.code(q["sql"], language="sql")
+            st.caption(f"params: {q['params']}")
+            st.code("\n".join(q["plan"]) or "(no plan)")
+
+# --- SIDEBAR FOOTER (rendered last so the counters include this rerun) ---
+_ci = cache_info()
+st.sidebar.caption(f"Query cache: {_ci['hits']} hits • {_ci['misses']} misses • {_ci['entries']} entries")
+if profile_settings()["enabled"] and page != "Diagnostics":
+    # the Diagnostics page shows the rerun before it, not its own
+    st.session_state["profile_last"] = rerun_profile
+    st.session_state["profile_session"] = merge_profile(st.session_state.get("profile_session") or new_profile(), rerun_profile)
@@ -0,0 +1,58 @@
+"""DB time per page render: connect-per-call vs pooled, tuned connections vs the result cache.
+
+    python benchmarks/bench_conn.py [--contacts 20000] [--renders 200]
+
+A "render" is the set of db calls a Dashboard + Contacts rerun makes.
+Runs against a throwaway SQLite file, never crm.sqlite3.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+from bench_import import make_rows  # noqa: E402
+
+
+def render():
+    db.kpis()
+    db.fetch_contacts()
+    db.fetch_contacts(status="Hot")
+    db.fetch_orders()
+    db.fetch_campaigns()
+
+
+def timed(renders):
+    t = time.perf_counter()
+    for _ in range(renders):
+        render()
+    return (time.perf_counter() - t) / renders * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--contacts", type=int, default=20000)
+    ap.add_argument("--renders", type=int, default=200)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.sqlite3"
+        db.init_db()
+        db.insert_contacts_bulk(make_rows(args.contacts))
+        tuned = dict(db.PRAGMAS)
+        db.configure_cache(size=0)
+        db.configure_pool(size=0, pragmas={"foreign_keys": "ON"})
+        before = timed(args.renders)
+        db.configure_pool(size=4, pragmas=tuned)
+        after = timed(args.renders)
+        db.configure_cache(size=256)
+        cached = timed(args.renders)
+        db.close_pools()
+    print(f"connect-per-call: {before:8.2f} ms/render")
+    print(f"pooled + pragmas: {after:8.2f} ms/render ({before / after:.1f}x)")
+    print(f"+ result cache:   {cached:8.2f} ms/render ({before / cached:.1f}x) {db.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
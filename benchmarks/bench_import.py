@@ -0,0 +1,59 @@
+"""Import throughput: per-row insert_contact loop vs insert_contacts_bulk.
+
+    python benchmarks/bench_import.py [--sizes 1000 10000 100000]
+
+Runs against a throwaway SQLite file, never crm.sqlite3.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+
+
+def make_rows(n):
+    return [dict(name=f"Contact {i}", phone=f"08{i:08d}", email=f"c{i}@example.co.za", source="GRW",
+                 interest="Luna", status="New", tags="GRW,2024", assigned="Vanto", notes="imported",
+                 action_needed="", action_taken="", username=f"APL{i}", password="")
+            for i in range(n)]
+
+
+def fresh_db(tmp, label):
+    db.DB_PATH = Path(tmp) / f"{label}.sqlite3"
+    db.init_db()
+
+
+def bench_loop(rows):
+    t = time.perf_counter()
+    for data in rows:
+        if data.get("name") or data.get("phone"):
+            db.insert_contact(data)
+    return time.perf_counter() - t
+
+
+def bench_bulk(rows):
+    t = time.perf_counter()
+    db.insert_contacts_bulk(rows)
+    return time.perf_counter() - t
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = ap.parse_args()
+    print(f"{'rows':>8} {'loop rows/s':>14} {'bulk rows/s':>14} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            rows = make_rows(n)
+            fresh_db(tmp, f"loop{n}")
+            loop = bench_loop(rows)
+            fresh_db(tmp, f"bulk{n}")
+            bulk = bench_bulk(rows)
+            print(f"{n:>8} {n / loop:>14,.0f} {n / bulk:>14,.0f} {loop / bulk:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Result-set memory and latency: raw tuples vs sqlite3.Row vs namedtuple records vs projected records.
+
+    python benchmarks/bench_rows.py [--contacts 100000] [--repeat 5]
+
+Each variant reads every contact (as fetch_contacts() does) and then builds the DataFrame a page
+would show. Memory is what the result list holds once read, measured with tracemalloc.
+Runs against a throwaway SQLite file, never crm.sqlite3.
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+from bench_import import make_rows  # noqa: E402
+
+ALL = "SELECT " + ",".join(db.CONTACT_COLUMNS) + " FROM contacts ORDER BY created_at DESC"
+
+
+def tuples():
+    with db.get_conn() as conn:
+        return conn.execute(ALL).fetchall()
+
+
+def sqlite_rows():
+    with db.get_conn() as conn:
+        conn.row_factory = sqlite3.Row
+        try:
+            return conn.execute(ALL).fetchall()
+        finally:
+            conn.row_factory = None
+
+
+VARIANTS = [
+    ("tuples (before)", tuples),
+    ("sqlite3.Row", sqlite_rows),
+    ("records", lambda: db.fetch_contacts()),
+    ("records id,name", lambda: db.fetch_contacts(columns=("id", "name"))),
+]
+
+
+def measure(fn, repeat):
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        rows = fn()
+    read_ms = (time.perf_counter() - t) / repeat * 1000
+    t = time.perf_counter()
+    pd.DataFrame([tuple(r) for r in rows]) if isinstance(rows[0], sqlite3.Row) else pd.DataFrame(rows)
+    df_ms = (time.perf_counter() - t) * 1000
+    del rows
+    tracemalloc.start()
+    rows = fn()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return read_ms, df_ms, held / 2**20, len(rows)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--contacts", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.sqlite3"
+        db.configure_cache(size=0)
+        db.init_db()
+        db.insert_contacts_bulk(make_rows(args.contacts), batch_size=5000)
+        print(f"{'variant':<18} {'read ms':>9} {'DataFrame ms':>13} {'held MiB':>9} {'rows':>8}")
+        for name, fn in VARIANTS:
+            read_ms, df_ms, mib, n = measure(fn, args.repeat)
+            print(f"{name:<18} {read_ms:>9.1f} {df_ms:>13.1f} {mib:>9.1f} {n:>8}")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
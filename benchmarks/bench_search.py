@@ -0,0 +1,64 @@
+"""Contacts/campaigns search latency: LIKE scan vs FTS5.
+
+    python benchmarks/bench_search.py [--contacts 100000] [--repeat 20]
+
+Runs against a throwaway SQLite file, never crm.sqlite3.
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+
+FIRST = ["Thabo", "Lerato", "Sipho", "Nomsa", "Pieter", "Anele", "Zanele", "Johan", "Kagiso", "Naledi"]
+LAST = ["Mokoena", "Dlamini", "Nkosi", "van der Merwe", "Botha", "Khumalo", "Naidoo", "Pillay"]
+PRODUCTS = ["Luna", "GRW", "STP", "NRM", "HPR", "ICE"]
+PHRASES = ["asked about {p} pricing", "membership expired last month", "wants a call back on Friday",
+           "interested in {p} for her mother", "referred by a friend in Soweto", "ordered {p} twice",
+           "prefers WhatsApp voice notes", "no reply after second follow-up", "attended the Durban event"]
+QUERIES = ["luna", "thabo", "soweto", "call back", "082", "mokoena luna", "zzz-no-hit"]
+
+
+def make_rows(n, rnd):
+    for i in range(n):
+        notes = ". ".join(rnd.choice(PHRASES).format(p=rnd.choice(PRODUCTS)) for _ in range(rnd.randint(1, 4)))
+        yield dict(name=f"{rnd.choice(FIRST)} {rnd.choice(LAST)}", phone=f"0{rnd.choice([72, 82, 83, 61])} {rnd.randint(100, 999)} {rnd.randint(1000, 9999)}",
+                   email=f"user{i}@example.co.za", interest=rnd.choice(PRODUCTS), status="New", notes=notes,
+                   action_needed=rnd.choice(["", "follow up", "send catalogue"]), action_taken="")
+
+
+def timed(query, repeat):
+    t = time.perf_counter()
+    for _ in range(repeat):
+        n = len(db.fetch_contacts(search=query))
+    return (time.perf_counter() - t) / repeat * 1000, n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--contacts", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.sqlite3"
+        db.configure_cache(size=0)
+        db.init_db()
+        if not db.FTS_ENABLED:
+            sys.exit("this SQLite build has no FTS5")
+        db.insert_contacts_bulk(make_rows(args.contacts, random.Random(42)), batch_size=5000)
+        print(f"{'query':<16} {'LIKE ms':>9} {'rows':>7} {'FTS5 ms':>9} {'rows':>7} {'speedup':>8}")
+        for q in QUERIES:
+            db.FTS_ENABLED = False
+            like_ms, like_n = timed(q, args.repeat)
+            db.FTS_ENABLED = True
+            fts_ms, fts_n = timed(q, args.repeat)
+            print(f"{q:<16} {like_ms:>9.2f} {like_n:>7} {fts_ms:>9.2f} {fts_n:>7} {like_ms / fts_ms:>7.1f}x")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
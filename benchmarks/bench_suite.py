@@ -0,0 +1,200 @@
+"""Every db.py entry point the app uses, timed on synthetic data at several sizes.
+
+    python benchmarks/bench_suite.py [--sizes 10000 100000 1000000] [--json results.json]
+                                     [--baseline old.json] [--data-dir DIR] [--budget 2]
+
+Each size gets a database from datagen.generate() (same --seed, same data). Reads run first
+with the result cache off, so every call hits SQLite; each case repeats until --budget seconds
+or --repeat runs, and the median is reported. Writes (imports, exports, campaign render,
+bulk updates, duplicate merge) run after the reads, on the same database. With --data-dir the generated
+databases are kept there and copied for each run, so large sizes are generated only once.
+
+--json writes machine-readable results (environment, and per size and case the median/min/max
+ms and result size); --baseline compares against such a file and prints the ratio per case.
+Runs against throwaway SQLite files, never crm.sqlite3.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+import exporter  # noqa: E402
+import importer  # noqa: E402
+import whatsapp  # noqa: E402
+from datagen import contact_rows, generate  # noqa: E402
+
+SEARCH, STATUS, TAG = "luna", "Hot", "VIP"
+
+
+def result_size(res):
+    # rows returned, or the count an operation reports (rows imported/merged, bytes written)
+    if isinstance(res, tuple) and len(res) == 2 and isinstance(res[0], list):
+        return len(res[0])  # (page rows, next cursor)
+    if isinstance(res, dict) and "tags" in res:
+        return len(res["tags"])  # contact_facets: distinct tags
+    if isinstance(res, (list, dict)):
+        return len(res)
+    if isinstance(res, int):
+        return res
+    return None
+
+
+def read_cases(contact_id):
+    cases = []
+    for s, st, tg in itertools.product(["", SEARCH], ["", STATUS], ["", TAG]):
+        label = "+".join(k for k, v in (("search", s), ("status", st), ("tag", tg)) if v) or "all"
+        cases += [
+            (f"fetch_contacts({label})", lambda s=s, st=st, tg=tg: db.fetch_contacts(s, st, tg)),
+            (f"fetch_contacts_page({label})", lambda s=s, st=st, tg=tg: db.fetch_contacts_page(s, st, tg, limit=50)),
+            (f"count_contacts({label})", lambda s=s, st=st, tg=tg: db.count_contacts(s, st, tg)),
+        ]
+    return cases + [
+        ("fetch_contacts(tags all)", lambda: db.fetch_contacts(tag=f"{TAG},Luna")),
+        ("fetch_contacts(tags any)", lambda: db.fetch_contacts(tag=f"{TAG},Luna", tag_mode="any")),
+        ("contact_facets", lambda: db.contact_facets()),
+        ("contact_facets(status+tag)", lambda: db.contact_facets(status=STATUS, tag=TAG)),
+        ("fetch_contacts(columns=id,name)", lambda: db.fetch_contacts(columns=("id", "name"))),
+        ("fetch_contact", lambda: db.fetch_contact(contact_id)),
+        ("fetch_orders", lambda: db.fetch_orders()),
+        ("fetch_orders(contact)", lambda: db.fetch_orders(contact_id)),
+        ("fetch_orders_page", lambda: db.fetch_orders_page(limit=50)),
+        ("count_orders", lambda: db.count_orders()),
+        ("fetch_campaigns", lambda: db.fetch_campaigns()),
+        ("fetch_campaigns(search)", lambda: db.fetch_campaigns("luna")),
+        ("fetch_campaigns_page", lambda: db.fetch_campaigns_page(limit=50)),
+        ("fetch_activities", lambda: db.fetch_activities(contact_id)),
+        ("fetch_timeline", lambda: db.fetch_timeline(contact_id, limit=50)),
+        ("kpis", lambda: db.kpis()),
+        ("kpi_series(90d)", lambda: db.kpi_series("2025-10-01")),
+        ("duplicate_stats", lambda: db.duplicate_stats()),
+    ]
+
+
+def import_file(n, seed):
+    # a CSV of n new contacts in the generator's style, half of them repeating existing phones
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(db.CONTACT_FIELDS)
+    for row, _ in contact_rows(n, random.Random(seed + 1), datetime(2024, 1, 1), 730, dup_rate=0.5):
+        w.writerow([row[k] for k in db.CONTACT_FIELDS])
+    return buf.getvalue().encode("utf-8")
+
+
+def write_cases(import_rows, seed):
+    data = import_file(import_rows, seed)
+    col_map = {f: f for f in db.CONTACT_FIELDS}
+    template = "Hi {name}, your {interest} order is waiting"
+    return [
+        (f"run_import(add, {import_rows})", lambda: importer.run_import(io.BytesIO(data), "add.csv", col_map)["inserted"]),
+        # the same file again: every row now matches a contact the first import added
+        (f"run_import(upsert, {import_rows})", lambda: importer.run_import(io.BytesIO(data), "upsert.csv", col_map, upsert=True)["updated"]),
+        ("write_csv(contacts)", lambda: exporter.write_csv("contacts", io.BytesIO())),
+        ("write_csv(contacts, status)", lambda: exporter.write_csv("contacts", io.BytesIO(), status=STATUS)),
+        ("write_csv(orders)", lambda: exporter.write_csv("orders", io.BytesIO())),
+        ("write_csv(activities)", lambda: exporter.write_csv("activities", io.BytesIO())),
+        ("write_xlsx(contacts, tag)", lambda: exporter.write_xlsx("contacts", io.BytesIO(), tag=TAG)),
+        ("run_campaign(status, no log)", lambda: whatsapp.run_campaign(template, {}, io.StringIO(), log=False, status=STATUS)["rendered"]),
+        ("bulk_update_contacts(status)", lambda: db.bulk_update_contacts({"assigned": "Bench"}, status=STATUS)["updated"]),
+        ("bulk_update_contacts(tag, tags)", lambda: db.bulk_update_contacts({"tags": f"{TAG},Bench"}, tag=TAG)["updated"]),
+        ("merge_duplicates", lambda: db.merge_duplicates()["merged"]),
+        ("rebuild_kpis", lambda: db.rebuild_kpis()),
+    ]
+
+
+def timed(fn, budget, repeat):
+    # writes run once: repeating an import or merge would measure a different operation
+    times, res = [], None
+    while len(times) < repeat and (not times or sum(times) < budget):
+        t = time.perf_counter()
+        res = fn()
+        times.append(time.perf_counter() - t)
+    return dict(median_ms=statistics.median(times) * 1000, min_ms=min(times) * 1000, max_ms=max(times) * 1000,
+                runs=len(times), result=result_size(res))
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = ""
+    return dict(at=datetime.now().isoformat(timespec="seconds"), commit=commit, python=platform.python_version(),
+                sqlite=sqlite3.sqlite_version, platform=platform.platform(), fts=db.FTS_ENABLED)
+
+
+def prepare(size, seed, data_dir, work):
+    # -> path of a database to run on: a copy of the one kept in data_dir, generated there if missing
+    target = work / f"run-{size}.sqlite3"
+    source = data_dir / f"synth-{size}-{seed}.sqlite3" if data_dir else target
+    if not source.exists():
+        db.DB_PATH = source
+        t = time.perf_counter()
+        progress = lambda table, n: print(f"\r  generating {table}: {n:,}".ljust(48), end="", flush=True)  # noqa: E731
+        generate(size, seed=seed, progress=progress if sys.stdout.isatty() else None)
+        print(f"\r  generated {size:,} contacts in {time.perf_counter() - t:.1f}s".ljust(48))
+        db.close_pools()
+    if source != target:
+        shutil.copyfile(source, target)
+    return target
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--budget", type=float, default=2.0, help="seconds per read case before it stops repeating")
+    ap.add_argument("--import-rows", type=int, default=10000)
+    ap.add_argument("--data-dir", type=Path)
+    ap.add_argument("--json", type=Path, help="write results here")
+    ap.add_argument("--baseline", type=Path, help="earlier --json output to compare with")
+    args = ap.parse_args()
+    baseline = {}
+    if args.baseline:
+        baseline = {(r["size"], r["case"]): r for r in json.loads(args.baseline.read_text())["results"]}
+    if args.data_dir:
+        args.data_dir.mkdir(parents=True, exist_ok=True)
+    db.configure_cache(size=0)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            print(f"{size:,} contacts")
+            db.DB_PATH = prepare(size, args.seed, args.data_dir, Path(tmp))
+            db.init_db()
+            with db.get_conn() as conn:
+                contact_id = conn.execute("SELECT contact_id FROM activities GROUP BY contact_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+            print(f"  {'case':<44} {'median ms':>10} {'result':>11} {'vs base':>8}")
+            for phase, cases in [("read", read_cases(contact_id)), ("write", write_cases(args.import_rows, args.seed))]:
+                for case, fn in cases:
+                    r = dict(size=size, case=case, phase=phase,
+                             **timed(fn, args.budget, args.repeat if phase == "read" else 1))
+                    results.append(r)
+                    base = baseline.get((size, case))
+                    ratio = f"{r['median_ms'] / base['median_ms']:>7.2f}x" if base and base["median_ms"] else ""
+                    result = "" if r["result"] is None else f"{r['result']:,}"
+                    print(f"  {case:<44} {r['median_ms']:>10.1f} {result:>11} {ratio:>8}")
+            db.close_pools()
+            Path(db.DB_PATH).unlink()
+    if args.json:
+        args.json.write_text(json.dumps(dict(environment=environment(), args=dict(sizes=args.sizes, seed=args.seed,
+                                             repeat=args.repeat, budget=args.budget, import_rows=args.import_rows),
+                                             results=results), indent=1))
+        print(f"results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Batch WhatsApp campaign: render + queue CSV + single-transaction activity logging.
+
+    python benchmarks/bench_whatsapp.py [--sizes 10000 100000]
+
+Compares the batch path with the old one-contact-at-a-time path (str.format, wa_link and
+insert_activity per contact) on the first 1,000 contacts of each segment.
+Runs against a throwaway SQLite file, never crm.sqlite3.
+"""
+import argparse
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import quote_plus
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+import whatsapp  # noqa: E402
+from bench_import import make_rows  # noqa: E402
+
+TEMPLATE = ("Hi 👋 {name}, it’s Vanto from APLGO SA.\n"
+            "Your membership expired, but {interest} is waiting for you 🌙.\n"
+            "Rejoin here 👉 https://myaplworld.com/pages.cfm?p=CC1809B8")
+
+def old_path(limit):
+    rows = db.fetch_contacts()[:limit]
+    t = time.perf_counter()
+    for r in rows:
+        filled = TEMPLATE.format(name=r[1], interest=r[5] or "")
+        f"https://wa.me/{db.normalize_phone(r[2])}?text={quote_plus(filled)}"
+        db.insert_activity(dict(contact_id=r[0], type="whatsapp", summary="Sent template", details=filled))
+    return (time.perf_counter() - t) / len(rows)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    args = ap.parse_args()
+    print(f"{'contacts':>9} {'batch s':>8} {'msgs/s':>10} {'old msgs/s':>11} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            db.DB_PATH = Path(tmp) / f"wa{n}.sqlite3"
+            db.configure_cache(size=0)
+            db.init_db()
+            db.insert_contacts_bulk(make_rows(n), batch_size=5000)
+            t = time.perf_counter()
+            res = whatsapp.run_campaign(TEMPLATE, dict(channel="WhatsApp", name="bench"), out=io.StringIO())
+            batch = time.perf_counter() - t
+            per_old = old_path(1000)
+            print(f"{n:>9} {batch:>8.2f} {res['rendered'] / batch:>10,.0f} {1 / per_old:>11,.0f} {per_old * res['rendered'] / batch:>7.1f}x")
+        db.close_pools()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Synthetic CRM data at realistic proportions, for benchmarks and trying the app at scale.
+
+    python benchmarks/datagen.py --contacts 100000 --out /tmp/crm_100k.sqlite3 [--seed 42]
+
+Contacts get South African phone numbers in the formats people actually type, 0-3 tags,
+free-text notes, a status mix weighted towards New/Warm, and signup dates spread over
+--days; a few percent share a phone or email with an earlier contact, as real imports do.
+Orders, campaigns and activities (some logged as campaign sends) hang off those contacts.
+The same --seed and sizes always produce the same database. Tables are created through
+db.init_db(), i.e. from db.SCHEMA_SQL and the migrations, so triggers and indexes are live.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+
+FIRST = ["Thabo", "Lerato", "Sipho", "Nomsa", "Pieter", "Anele", "Zanele", "Johan", "Kagiso", "Naledi",
+         "Bongani", "Precious", "Mpho", "Ayanda", "Ruan", "Fatima", "Themba", "Lindiwe", "Sibusiso", "Karabo"]
+LAST = ["Mokoena", "Dlamini", "Nkosi", "van der Merwe", "Botha", "Khumalo", "Naidoo", "Pillay",
+        "Ndlovu", "Mahlangu", "Zulu", "Pretorius", "Molefe", "Sithole", "Govender", "Jacobs"]
+PRODUCTS = ["Luna", "GRW", "STP", "NRM", "HPR", "ICE", "AIR", "RLX"]
+PRICES = {"Luna": 650.0, "GRW": 375.0, "STP": 560.0, "NRM": 560.0, "HPR": 560.0, "ICE": 560.0, "AIR": 560.0, "RLX": 560.0}
+TAGS = ["GRW", "2024", "2025", "VIP", "Luna", "Event-Durban", "Event-JHB", "Lapsed", "Referral", "Facebook"]
+SOURCES = ["Facebook", "TikTok", "WhatsApp group", "Referral", "Event", "Website", ""]
+ASSIGNED = ["Vanto", "Thandi", "Sizwe", "Marelize", ""]
+STATUSES = [("New", 40), ("Warm", 25), ("Hot", 10), ("Customer", 15), ("Inactive", 10)]
+ORDER_STATUSES = [("Pending", 15), ("Paid", 35), ("Shipped", 20), ("Delivered", 30)]
+ACTIVITY_TYPES = ["call", "whatsapp", "email", "meeting", "note"]
+CHANNELS = ["WhatsApp", "Facebook", "TikTok", "Email"]
+PHRASES = ["asked about {p} pricing", "membership expired last month", "wants a call back on Friday",
+           "interested in {p} for her mother", "referred by a friend in Soweto", "ordered {p} twice",
+           "prefers WhatsApp voice notes", "no reply after second follow-up", "attended the Durban event",
+           "moving to Cape Town in March", "needs POP before shipping", "asked for the {p} catalogue"]
+PREFIXES = ["60", "61", "62", "63", "71", "72", "73", "74", "76", "78", "79", "81", "82", "83", "84"]
+
+
+def sa_phone(rnd):
+    local = f"{rnd.choice(PREFIXES)}{rnd.randint(0, 9999999):07d}"
+    return rnd.choice([
+        f"0{local}", f"0{local[:2]} {local[2:5]} {local[5:]}", f"+27 {local[:2]} {local[2:5]} {local[5:]}",
+        f"27{local}", f"(0{local[:2]}) {local[2:5]}-{local[5:]}", ""])
+
+
+def weighted(rnd, choices):
+    return rnd.choices([c for c, _ in choices], weights=[w for _, w in choices])[0]
+
+
+def stamp(start, rnd, days):
+    return (start + timedelta(seconds=rnd.randint(0, days * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def contact_rows(n, rnd, start, days, dup_rate=0.03):
+    # -> (CONTACT_FIELDS dict, created_at); ~dup_rate of them reuse an earlier phone/email
+    seen = []
+    for i in range(n):
+        name = f"{rnd.choice(FIRST)} {rnd.choice(LAST)}"
+        phone, email = sa_phone(rnd), rnd.choice(["", f"{name.split()[0].lower()}{i}@{rnd.choice(['gmail.com', 'yahoo.co.za', 'webmail.co.za'])}"])
+        if seen and rnd.random() < dup_rate:
+            phone, email = rnd.choice(seen)
+        elif len(seen) < 10000:
+            seen.append((phone, email.upper() if email and rnd.random() < 0.2 else email))
+        product = rnd.choice(PRODUCTS)
+        notes = ". ".join(rnd.choice(PHRASES).format(p=rnd.choice(PRODUCTS)) for _ in range(rnd.randint(0, 3)))
+        yield dict(name=name, phone=phone, email=email, source=rnd.choice(SOURCES), interest=product,
+                   status=weighted(rnd, STATUSES), tags=",".join(rnd.sample(TAGS, rnd.choice([0, 1, 1, 2, 3]))),
+                   assigned=rnd.choice(ASSIGNED), notes=notes,
+                   action_needed=rnd.choice(["", "", "follow up", "send catalogue", "confirm payment"]),
+                   action_taken=rnd.choice(["", "", "called", "sent price list"]),
+                   username=f"APL{100000 + i}" if rnd.random() < 0.3 else "", password=""), stamp(start, rnd, days)
+
+
+def batched(rows, size):
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(contacts: int, seed: int = 42, days: int = 730, orders_per_contact: float = 0.6,
+             activities_per_contact: float = 2.0, campaigns: int = 200, batch_size: int = 10000, progress=None) -> dict:
+    # Fills the database at db.DB_PATH (creating it); returns the row counts and seconds taken.
+    # progress(table, rows_so_far) after every committed batch.
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    t = time.perf_counter()
+    db.init_db()
+    insert_contact = db.INSERT_CONTACT_SQL.replace(") VALUES (", ",created_at) VALUES (?,")
+    done = 0
+    for batch in batched(contact_rows(contacts, rnd, start, days), batch_size):
+        with db.get_conn() as conn:
+            conn.executemany(insert_contact, [db.contact_values(r) + [at] for r, at in batch])
+        done += len(batch)
+        if progress:
+            progress("contacts", done)
+    with db.get_conn() as conn:
+        first_id = conn.execute("SELECT IFNULL(MIN(id), 1) FROM contacts").fetchone()[0]
+
+    def pick_contact():
+        return first_id + rnd.randrange(contacts)
+
+    campaign_rows = [(stamp(start, rnd, days), rnd.choice(CHANNELS), f"{rnd.choice(PRODUCTS)} push {i}",
+                      rnd.choice(["All contacts", "Lapsed members", "Hot leads", "Durban event"]),
+                      "Hi {name}, " + rnd.choice(PHRASES).format(p=rnd.choice(PRODUCTS)),
+                      rnd.choice(["Sent", "Sent", "Partial", ""]), "") for i in range(campaigns)]
+    with db.get_conn() as conn:
+        conn.executemany("INSERT INTO campaigns (date, channel, name, audience, message, outcome, notes) VALUES (?,?,?,?,?,?,?)",
+                         campaign_rows)
+        campaign_ids = [r[0] for r in conn.execute("SELECT id FROM campaigns ORDER BY id")]
+
+    def orders():
+        for _ in range(int(contacts * orders_per_contact)):
+            product, qty = rnd.choice(PRODUCTS), rnd.choice([1, 1, 1, 2, 3])
+            yield (pick_contact(), product, qty, PRICES[product] * qty, weighted(rnd, ORDER_STATUSES),
+                   rnd.choice(["", "", "https://drive.example/pop.pdf"]), rnd.choice(["", "", "courier", "collect"]),
+                   stamp(start, rnd, days))
+
+    def activities():
+        for _ in range(int(contacts * activities_per_contact)):
+            campaign = rnd.choice(campaign_ids) if campaign_ids and rnd.random() < 0.4 else None
+            yield (pick_contact(), stamp(start, rnd, days), "whatsapp" if campaign else rnd.choice(ACTIVITY_TYPES),
+                   "Sent template" if campaign else rnd.choice(PHRASES).format(p=rnd.choice(PRODUCTS)),
+                   rnd.choice(["", "left voice note", "no answer"]), campaign)
+
+    for table, sql, rows in [
+        ("orders", "INSERT INTO orders (contact_id, product, quantity, amount, status, pop_url, notes, created_at) VALUES (?,?,?,?,?,?,?,?)", orders()),
+        ("activities", "INSERT INTO activities (contact_id, activity_date, type, summary, details, campaign_id) VALUES (?,?,?,?,?,?)", activities()),
+    ]:
+        done = 0
+        for batch in batched(rows, batch_size):
+            with db.get_conn() as conn:
+                conn.executemany(sql, batch)
+            done += len(batch)
+            if progress:
+                progress(table, done)
+    with db.get_conn() as conn:
+        # rows went in with plain SQL, not through db's write functions
+        db.backfill_contact_tags(conn, batch_size)
+    with db.get_conn() as conn:
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("contacts", "orders", "campaigns", "activities")}
+        conn.execute("ANALYZE")
+    return dict(counts, seconds=time.perf_counter() - t)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--contacts", type=int, default=100000)
+    ap.add_argument("--out", type=Path, required=True)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--days", type=int, default=730)
+    args = ap.parse_args()
+    if args.out.exists():
+        sys.exit(f"{args.out} already exists")
+    db.DB_PATH = args.out
+    res = generate(args.contacts, seed=args.seed, days=args.days,
+                   progress=(lambda table, n: print(f"\r{table}: {n:,}".ljust(24), end="", flush=True)) if sys.stdout.isatty() else None)
+    db.close_pools()
+    print(f"\r{args.out}: " + ", ".join(f"{res[t]:,} {t}" for t in ("contacts", "orders", "campaigns", "activities"))
+          + f" in {res['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
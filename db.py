@@ -1,10 +1,29 @@
 
+import functools
+import json
+import queue
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
 from contextlib import contextmanager
 from pathlib import Path
 
 DB_PATH = Path(__file__).with_name("crm.sqlite3")
 
+# Applied to every pooled connection (journal_mode=WAL is persisted in the file, the rest are per connection).
+# Change with configure_pool(); POOL_SIZE is how many idle connections are kept per database file.
+POOL_SIZE = 4
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "cache_size": -16000,     # KiB when negative, i.e. ~16 MB page cache
+    "mmap_size": 134217728,   # 128 MB
+    "temp_store": "MEMORY",
+}
+
 SCHEMA_SQL = """
 PRAGMA foreign_keys = ON;
 
@@ -23,6 +42,8 @@ CREATE TABLE IF NOT EXISTS contacts (
   action_taken TEXT,
   username TEXT,
   password TEXT,
+  phone_key TEXT,           -- normalize_phone(phone), '' when there is none, NULL until backfilled
+  email_key TEXT,           -- lower-cased email, same conventions
   created_at TEXT DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -57,77 +78,1183 @@ CREATE TABLE IF NOT EXISTS activities (
   type TEXT,
   summary TEXT,
   details TEXT,
+  campaign_id INTEGER,      -- set when the activity was logged as part of a campaign batch
   FOREIGN KEY(contact_id) REFERENCES contacts(id) ON DELETE CASCADE
 );
+
+-- one row per file import; rows_done is committed together with each chunk so an interrupted
+-- import can be resumed from the last committed chunk
+CREATE TABLE IF NOT EXISTS imports (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  file_name TEXT,
+  fingerprint TEXT,         -- sha1 of the file contents
+  col_map TEXT,             -- JSON {crm field: file column}
+  status TEXT,              -- running, done
+  rows_done INTEGER DEFAULT 0,
+  inserted INTEGER DEFAULT 0,
+  updated INTEGER DEFAULT 0,
+  skipped INTEGER DEFAULT 0,
+  started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  finished_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_contacts_created_at ON contacts(created_at);
+CREATE INDEX IF NOT EXISTS idx_contacts_status_created ON contacts(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_contact_created ON orders(contact_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_status_amount ON orders(status, amount);
+CREATE INDEX IF NOT EXISTS idx_campaigns_date ON campaigns(date);
+CREATE INDEX IF NOT EXISTS idx_activities_contact_date ON activities(contact_id, activity_date);
+CREATE INDEX IF NOT EXISTS idx_imports_fingerprint ON imports(fingerprint, status);
+"""
+
+# Full-text search: external-content FTS5 tables mirroring the columns the search boxes look at,
+# kept in sync by triggers. Created by migration 5 when the SQLite build has FTS5; otherwise
+# FTS_ENABLED stays False and searches use the LIKE fallback.
+CONTACT_SEARCH_FIELDS = ["name","phone","email","interest","notes","action_needed","action_taken"]
+CAMPAIGN_SEARCH_FIELDS = ["name","audience","message","notes"]
+FTS_ENABLED = False
+
+def fts_sql(table: str, cols: list) -> str:
+    c = ",".join(cols)
+    new = ",".join(f"new.{x}" for x in cols)
+    old = ",".join(f"old.{x}" for x in cols)
+    return f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5({c}, content='{table}', content_rowid='id', prefix='2 3');
+CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+  INSERT INTO {table}_fts(rowid,{c}) VALUES (new.id,{new});
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+  INSERT INTO {table}_fts({table}_fts,rowid,{c}) VALUES ('delete',old.id,{old});
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {c} ON {table} BEGIN
+  INSERT INTO {table}_fts({table}_fts,rowid,{c}) VALUES ('delete',old.id,{old});
+  INSERT INTO {table}_fts(rowid,{c}) VALUES (new.id,{new});
+END;
+"""
+
+def fts_query(search: str) -> str:
+    # every word becomes a quoted prefix term, all terms must match: "vant sa" -> "vant"* "sa"*
+    return " ".join(f'"{t}"*' for t in re.findall(r"\w+", search))
+
+# Dashboard aggregates, maintained by triggers so kpis() reads a few rows instead of scanning.
+# kpi_contacts counts contacts per (signup day, current status); kpi_orders counts orders and sums
+# amount per (order day, status). day='*' rows hold the all-time totals, day='' collects NULL dates.
+# rebuild_kpis() recomputes both from scratch.
+REVENUE_STATUSES = ("Paid","Shipped","Delivered")
+
+KPI_SQL = """
+CREATE TABLE IF NOT EXISTS kpi_contacts (
+  day TEXT NOT NULL,
+  status TEXT NOT NULL,
+  n INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, status)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS kpi_orders (
+  day TEXT NOT NULL,
+  status TEXT NOT NULL,
+  n INTEGER NOT NULL DEFAULT 0,
+  amount REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, status)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS kpi_contacts_ai AFTER INSERT ON contacts BEGIN
+  INSERT INTO kpi_contacts(day,status,n) VALUES
+    (IFNULL(date(new.created_at),''), IFNULL(new.status,''), 1), ('*', IFNULL(new.status,''), 1)
+    ON CONFLICT(day,status) DO UPDATE SET n = n + excluded.n;
+END;
+CREATE TRIGGER IF NOT EXISTS kpi_contacts_ad AFTER DELETE ON contacts BEGIN
+  UPDATE kpi_contacts SET n = n - 1
+    WHERE status = IFNULL(old.status,'') AND day IN (IFNULL(date(old.created_at),''), '*');
+END;
+CREATE TRIGGER IF NOT EXISTS kpi_contacts_au AFTER UPDATE OF status, created_at ON contacts BEGIN
+  UPDATE kpi_contacts SET n = n - 1
+    WHERE status = IFNULL(old.status,'') AND day IN (IFNULL(date(old.created_at),''), '*');
+  INSERT INTO kpi_contacts(day,status,n) VALUES
+    (IFNULL(date(new.created_at),''), IFNULL(new.status,''), 1), ('*', IFNULL(new.status,''), 1)
+    ON CONFLICT(day,status) DO UPDATE SET n = n + excluded.n;
+END;
+
+CREATE TRIGGER IF NOT EXISTS kpi_orders_ai AFTER INSERT ON orders BEGIN
+  INSERT INTO kpi_orders(day,status,n,amount) VALUES
+    (IFNULL(date(new.created_at),''), IFNULL(new.status,''), 1, IFNULL(new.amount,0)),
+    ('*', IFNULL(new.status,''), 1, IFNULL(new.amount,0))
+    ON CONFLICT(day,status) DO UPDATE SET n = n + excluded.n, amount = amount + excluded.amount;
+END;
+CREATE TRIGGER IF NOT EXISTS kpi_orders_ad AFTER DELETE ON orders BEGIN
+  UPDATE kpi_orders SET n = n - 1, amount = amount - IFNULL(old.amount,0)
+    WHERE status = IFNULL(old.status,'') AND day IN (IFNULL(date(old.created_at),''), '*');
+END;
+CREATE TRIGGER IF NOT EXISTS kpi_orders_au AFTER UPDATE OF status, amount, created_at ON orders BEGIN
+  UPDATE kpi_orders SET n = n - 1, amount = amount - IFNULL(old.amount,0)
+    WHERE status = IFNULL(old.status,'') AND day IN (IFNULL(date(old.created_at),''), '*');
+  INSERT INTO kpi_orders(day,status,n,amount) VALUES
+    (IFNULL(date(new.created_at),''), IFNULL(new.status,''), 1, IFNULL(new.amount,0)),
+    ('*', IFNULL(new.status,''), 1, IFNULL(new.amount,0))
+    ON CONFLICT(day,status) DO UPDATE SET n = n + excluded.n, amount = amount + excluded.amount;
+END;
 """
 
+# Streamlit runs each session on its own thread, so connections are opened with
+# check_same_thread=False and handed to one thread at a time. An empty pool opens a
+# new connection; a full pool closes the released one instead of keeping it.
+class ConnectionPool:
+    def __init__(self, path, size: int, pragmas: dict):
+        self.path = path
+        self.size = size
+        self.pragmas = dict(pragmas)
+        self._idle = queue.LifoQueue()
+        self.opened = 0
+        self.closed = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        for key, val in self.pragmas.items():
+            conn.execute(f"PRAGMA {key}={val}")
+        self.opened += 1
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+            self.closed += 1
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+                self.closed += 1
+            except queue.Empty:
+                return
+
+# When set, every connection handed out by get_conn() reports executed SQL to it (see check_query_plans).
+_trace_callback = None
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    # keyed on DB_PATH so pointing the module at another file (tests, benchmarks) gets its own pool
+    key = str(DB_PATH)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(DB_PATH, POOL_SIZE, PRAGMAS)
+        return pool
+
+def configure_pool(size: int = None, pragmas: dict = None):
+    # size=0 disables pooling (connect/close per call); pragmas replaces PRAGMAS wholesale
+    global POOL_SIZE, PRAGMAS
+    if size is not None:
+        POOL_SIZE = size
+    if pragmas is not None:
+        PRAGMAS = dict(pragmas)
+    close_pools()
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+# --- RESULT CACHE ---
+# Read functions decorated with @cached keep their results in a process-wide LRU shared by every
+# Streamlit session. Entries are tagged with the data version current when they were read; any
+# get_conn() block that changes rows bumps the version and drops the cache, so a write made through
+# this module is never followed by a stale read. CACHE_TTL bounds staleness from writers outside
+# this process (e.g. a second app instance). CACHE_SIZE=0 turns caching off.
+CACHE_SIZE = 256
+CACHE_TTL = 300.0
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_data_version = 0
+cache_stats = dict(hits=0, misses=0, evictions=0, invalidations=0)
+
+def cache_arg(v):
+    # columns=["id","name"] and columns=("id","name") are the same call
+    return tuple(cache_arg(x) for x in v) if isinstance(v, list) else v
+
+def cached(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if CACHE_SIZE <= 0:
+            return fn(*args, **kwargs)
+        key = (fn.__name__, str(DB_PATH), tuple(cache_arg(a) for a in args),
+               tuple(sorted((k, cache_arg(v)) for k, v in kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return fn(*args, **kwargs)   # e.g. a dict argument: not cacheable, but still a valid call
+        now = time.monotonic()
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry and entry[0] == _data_version and now - entry[1] < CACHE_TTL:
+                _cache.move_to_end(key)
+                cache_stats["hits"] += 1
+                return entry[2]
+            cache_stats["misses"] += 1
+            version = _data_version
+        value = fn(*args, **kwargs)
+        with _cache_lock:
+            # only keep it if no write landed while we were reading
+            if version == _data_version:
+                _cache[key] = (version, now, value)
+                _cache.move_to_end(key)
+                while len(_cache) > CACHE_SIZE:
+                    _cache.popitem(last=False)
+                    cache_stats["evictions"] += 1
+        return value
+    return wrapper
+
+def bump_data_version():
+    global _data_version
+    with _cache_lock:
+        _data_version += 1
+        _cache.clear()
+        cache_stats["invalidations"] += 1
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+def configure_cache(size: int = None, ttl: float = None):
+    global CACHE_SIZE, CACHE_TTL
+    if size is not None:
+        CACHE_SIZE = size
+    if ttl is not None:
+        CACHE_TTL = ttl
+    clear_cache()
+
+def cache_info() -> dict:
+    with _cache_lock:
+        return dict(cache_stats, entries=len(_cache), version=_data_version, size=CACHE_SIZE, ttl=CACHE_TTL)
+
+# --- PROFILING ---
+# Off by default (configure_profiling(enabled=True) turns it on). While on, every @profiled function
+# call and every statement run through get_conn() is timed into a histogram (PROFILE_BUCKETS_MS
+# upper bounds, plus one overflow bucket) with its row count; statements slower than PROFILE_SLOW_MS
+# go to the slow-query log together with their EXPLAIN QUERY PLAN. A statement's time runs from
+# execute() until its rows have been fetched. Totals are process-wide; start_profile_scope() also
+# collects one thread's share (Streamlit runs each rerun on its session's thread).
+PROFILE_ENABLED = False
+PROFILE_SLOW_MS = 100.0
+PROFILE_BUCKETS_MS = (1, 5, 25, 100, 500, 2000)
+PROFILE_SLOW_LOG_SIZE = 50
+
+def new_profile() -> dict:
+    return dict(functions={}, sql={}, checkouts=0)
+
+_profile = new_profile()
+_profile_lock = threading.Lock()
+_profile_local = threading.local()
+slow_queries = deque(maxlen=PROFILE_SLOW_LOG_SIZE)
+
+def configure_profiling(enabled: bool = None, slow_ms: float = None):
+    global PROFILE_ENABLED, PROFILE_SLOW_MS
+    if enabled is not None:
+        PROFILE_ENABLED = enabled
+    if slow_ms is not None:
+        PROFILE_SLOW_MS = slow_ms
+
+def profile_settings() -> dict:
+    return dict(enabled=PROFILE_ENABLED, slow_ms=PROFILE_SLOW_MS, buckets_ms=PROFILE_BUCKETS_MS)
+
+def reset_profile():
+    global _profile
+    with _profile_lock:
+        _profile = new_profile()
+        slow_queries.clear()
+
+def start_profile_scope() -> dict:
+    # from now on this thread's records also go into the returned dict (replacing any earlier scope)
+    _profile_local.scope = new_profile()
+    return _profile_local.scope
+
+def profile_targets() -> list:
+    scope = getattr(_profile_local, "scope", None)
+    return [_profile, scope] if scope is not None else [_profile]
+
+def new_timing() -> dict:
+    return dict(calls=0, total_ms=0.0, max_ms=0.0, rows=0, hist=[0] * (len(PROFILE_BUCKETS_MS) + 1))
+
+def record_timing(kind: str, key: str, ms: float, rows: int = 0):
+    bucket = next((i for i, b in enumerate(PROFILE_BUCKETS_MS) if ms <= b), len(PROFILE_BUCKETS_MS))
+    with _profile_lock:
+        for target in profile_targets():
+            e = target[kind].get(key) or target[kind].setdefault(key, new_timing())
+            e["calls"] += 1
+            e["total_ms"] += ms
+            e["max_ms"] = max(e["max_ms"], ms)
+            e["rows"] += rows
+            e["hist"][bucket] += 1
+
+def merge_profile(into: dict, other: dict) -> dict:
+    # adds other's totals to into (e.g. one rerun's scope into a session total)
+    for kind in ("functions", "sql"):
+        for key, src in other[kind].items():
+            e = into[kind].setdefault(key, new_timing())
+            for k in ("calls", "total_ms", "rows"):
+                e[k] += src[k]
+            e["max_ms"] = max(e["max_ms"], src["max_ms"])
+            e["hist"] = [a + b for a, b in zip(e["hist"], src["hist"])]
+    into["checkouts"] += other["checkouts"]
+    return into
+
+def profile_snapshot() -> dict:
+    with _profile_lock:
+        snap = json.loads(json.dumps(_profile))
+    snap["pools"] = {path: dict(opened=p.opened, closed=p.closed, idle=p._idle.qsize()) for path, p in list(_pools.items())}
+    return snap
+
+def profile_report(profile: dict, kind: str = "sql", top: int = 20) -> list:
+    # -> the top entries by total time: [dict(key, calls, total_ms, avg_ms, max_ms, rows, hist)]
+    rows = [dict(key=k, calls=e["calls"], total_ms=e["total_ms"], avg_ms=e["total_ms"] / e["calls"],
+                 max_ms=e["max_ms"], rows=e["rows"], hist=e["hist"]) for k, e in profile[kind].items()]
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)[:top]
+
+def profiled(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not PROFILE_ENABLED:
+            return fn(*args, **kwargs)
+        t = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            record_timing("functions", fn.__name__, (time.perf_counter() - t) * 1000)
+    return wrapper
+
+class ProfiledCursor:
+    # times one statement from execute() until its rows are fetched (or, for writes, right away)
+    def __init__(self, conn, cur, sql, params, started):
+        self._conn, self._cur, self._sql, self._params, self._started = conn, cur, sql, params, started
+        self._rows, self._done = 0, False
+        if cur.description is None:
+            self._finish(max(cur.rowcount, 0))
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def _finish(self, rows: int = 0, explain: bool = True):
+        if self._done:
+            return
+        self._done = True
+        self._rows += rows
+        ms = (time.perf_counter() - self._started) * 1000
+        sql = " ".join(self._sql.split())
+        record_timing("sql", sql, ms, self._rows)
+        if ms >= PROFILE_SLOW_MS:
+            try:
+                plan = [r[3] for r in self._conn.execute("EXPLAIN QUERY PLAN " + self._sql, self._params or ()).fetchall()] if explain and self._params is not None else []
+            except sqlite3.Error as e:
+                plan = [f"(no plan: {e})"]
+            slow_queries.append(dict(at=time.time(), sql=sql, params=repr(self._params)[:200], ms=ms, rows=self._rows, plan=plan))
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        self._finish(row is not None)
+        return row
+
+    def fetchmany(self, size: int = None):
+        rows = self._cur.fetchmany(size or self._cur.arraysize)
+        self._rows += len(rows)
+        if len(rows) < (size or self._cur.arraysize):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._cur.fetchall()
+        self._finish(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cur:
+            self._rows += 1
+            yield row
+        self._finish()
+
+    def __del__(self):
+        # a cursor dropped before its last row still gets counted; its connection may already be
+        # back in the pool (and in use on another thread), so no EXPLAIN for it
+        self._finish(explain=False)
+
+class ProfiledConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    # `with conn:` looks these up on the type, where __getattr__ doesn't reach
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def execute(self, sql, params=()):
+        t = time.perf_counter()
+        return ProfiledCursor(self._conn, self._conn.execute(sql, params), sql, params, t)
+
+    def executemany(self, sql, seq):
+        # params=None: no EXPLAIN for slow batches, there is no single parameter set to plan with
+        t = time.perf_counter()
+        return ProfiledCursor(self._conn, self._conn.executemany(sql, seq), sql, None, t)
+
 @contextmanager
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+def get_conn(invalidate: bool = True):
+    # invalidate=False is for bookkeeping writes no cached read depends on (job progress, import
+    # status), so a running job doesn't keep emptying the result cache
+    pool = get_pool()
+    raw = pool.acquire()
+    conn = raw
+    if PROFILE_ENABLED:
+        conn = ProfiledConnection(raw)
+        with _profile_lock:
+            for target in profile_targets():
+                target["checkouts"] += 1
+    trace = _trace_callback
+    if trace:
+        raw.set_trace_callback(trace)
+    changes = raw.total_changes
     try:
         yield conn
-        conn.commit()
+        raw.commit()
     finally:
-        conn.close()
-
-def init_db():
-    with get_conn() as conn:
-        conn.executescript(SCHEMA_SQL)
-        # try to add new columns if upgrading
-        cols = [r[1] for r in conn.execute("PRAGMA table_info(contacts)").fetchall()]
-        for col, sql in [
-            ("action_needed","ALTER TABLE contacts ADD COLUMN action_needed TEXT"),
-            ("action_taken","ALTER TABLE contacts ADD COLUMN action_taken TEXT"),
-            ("username","ALTER TABLE contacts ADD COLUMN username TEXT"),
-            ("password","ALTER TABLE contacts ADD COLUMN password TEXT"),
-        ]:
-            if col not in cols:
-                try:
-                    conn.execute(sql)
-                except Exception:
-                    pass
+        # also on error: a block that committed part-way (batched writes) must still drop stale reads
+        if invalidate and raw.total_changes != changes:
+            bump_data_version()
+        if trace:
+            raw.set_trace_callback(None)
+        pool.release(raw)
+
+# --- MIGRATIONS ---
+# The schema version lives in PRAGMA user_version; MIGRATIONS lists (version, description, step,
+# batched) in order and init_db() runs the steps above the stored version. A plain step runs in one
+# BEGIN IMMEDIATE transaction together with its user_version bump, so it is applied whole or not at
+# all. A batched step (large backfills) commits every batch on its own so other connections can
+# write in between; it must be safe to re-run, since a crash mid-way repeats it from the start.
+# SCHEMA_SQL is the current schema of a fresh database: when it changes, add a step that brings
+# existing databases to the same shape (add_column, CREATE ... IF NOT EXISTS), never edit old steps.
+# Databases from before user_version was used are version 0; every step is written to be a no-op on
+# whatever they already have.
+def run_script(conn, sql: str):
+    # executescript() would COMMIT first; this runs the statements inside the open transaction
+    stmt = ""
+    for line in sql.splitlines(keepends=True):
+        stmt += line
+        if sqlite3.complete_statement(stmt):
+            conn.execute(stmt)
+            stmt = ""
+
+def add_column(conn, table: str, col: str, decl: str):
+    if col not in [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+
+def migrate_base(conn):
+    run_script(conn, SCHEMA_SQL)
+    for col in ["action_needed", "action_taken", "username", "password"]:
+        add_column(conn, "contacts", col, "TEXT")
+
+def migrate_campaign_batches(conn):
+    add_column(conn, "activities", "campaign_id", "INTEGER")
+    add_column(conn, "imports", "updated", "INTEGER DEFAULT 0")
+
+def migrate_contact_keys(conn):
+    add_column(conn, "contacts", "phone_key", "TEXT")
+    add_column(conn, "contacts", "email_key", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_contacts_phone_key ON contacts(phone_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_contacts_email_key ON contacts(email_key)")
+
+def migrate_fts(conn):
+    # SQLite builds without FTS5 skip this step for good; searches then use the LIKE fallback
+    try:
+        for table, cols in [("contacts", CONTACT_SEARCH_FIELDS), ("campaigns", CAMPAIGN_SEARCH_FIELDS)]:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (f"{table}_fts",)).fetchone()
+            run_script(conn, fts_sql(table, cols))
+            if not exists:
+                # existing database: index the rows that are already there
+                conn.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+
+def migrate_kpis(conn):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name='kpi_contacts'").fetchone()
+    run_script(conn, KPI_SQL)
+    if not exists:
+        rebuild_kpis(conn)
+
+MIGRATIONS = [
+    (1, "base tables and indexes", migrate_base, False),
+    (2, "campaign batches, import update counts", migrate_campaign_batches, False),
+    (3, "contact phone/email keys", migrate_contact_keys, False),
+    (4, "backfill contact keys", lambda conn: backfill_contact_keys(conn), True),
+    (5, "full-text search tables", migrate_fts, False),
+    (6, "KPI summary tables", migrate_kpis, False),
+    (7, "contact_tags table", lambda conn: run_script(conn, CONTACT_TAGS_SQL), False),
+    (8, "backfill contact_tags", lambda conn: backfill_contact_tags(conn), True),
+    (9, "background jobs table", lambda conn: run_script(conn, JOBS_SQL), False),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
 
+def migrate(conn, migrations=None) -> list:
+    # -> [(version, description, seconds)] for the steps that ran
+    ran = []
+    for version, description, step, batched in migrations or MIGRATIONS:
+        if schema_version(conn) >= version:
+            continue
+        t = time.perf_counter()
+        try:
+            if batched:
+                step(conn)
+                conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+            # re-checked under the write lock: another process may have just applied it
+            if schema_version(conn) >= version:
+                conn.commit()
+                continue
+            if not batched:
+                step(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        ran.append((version, description, time.perf_counter() - t))
+    return ran
+
+# init_db() is called at the top of every Streamlit rerun; after the first call per database file
+# it only returns what that first call did.
+_migrated = {}
+_migrate_lock = threading.Lock()
+
+def init_db() -> list:
+    # -> [(version, description, seconds)] of the migrations this process applied to DB_PATH
+    global FTS_ENABLED
+    key = str(DB_PATH)
+    with _migrate_lock:
+        if key not in _migrated:
+            with get_conn() as conn:
+                ran = migrate(conn)
+                # refresh planner statistics for new indexes (cheap no-op when nothing changed)
+                conn.execute("PRAGMA optimize")
+                fts = bool(conn.execute("SELECT 1 FROM sqlite_master WHERE name='contacts_fts'").fetchone())
+            _migrated[key] = (ran, fts)
+        ran, FTS_ENABLED = _migrated[key]
+    return ran
+
+CONTACT_FIELDS = ["name","phone","email","source","interest","status","tags","assigned","notes","action_needed","action_taken","username","password"]
+
+# --- DUPLICATE KEYS ---
+# phone_key/email_key identify the same person across imports. NULL means "not computed yet"
+# (rows from before the columns existed, filled in by backfill_contact_keys), '' means no key.
+def normalize_phone(phone) -> str:
+    # digits only, local 0-prefix replaced by the SA country code: "082 123 4567" -> "27821234567"
+    p = "".join(c for c in str(phone or "") if c.isdigit())
+    if p.startswith("0"):
+        p = "27" + p[1:]
+    return p
+
+def normalize_email(email) -> str:
+    return str(email or "").strip().lower()
+
+def contact_values(data: dict) -> list:
+    # CONTACT_FIELDS values followed by the two keys, in INSERT_CONTACT_SQL order
+    return [data.get(k) for k in CONTACT_FIELDS] + [normalize_phone(data.get("phone")), normalize_email(data.get("email"))]
+
+def backfill_contact_keys(conn, batch_size: int = 5000) -> int:
+    n = 0
+    while True:
+        rows = conn.execute("SELECT id, phone, email FROM contacts WHERE phone_key IS NULL LIMIT ?", (batch_size,)).fetchall()
+        if not rows:
+            return n
+        conn.executemany("UPDATE contacts SET phone_key=?, email_key=? WHERE id=?",
+                         [(normalize_phone(p), normalize_email(e), i) for i, p, e in rows])
+        conn.commit()
+        n += len(rows)
+
+# --- TAGS ---
+# contacts.tags stays the editable comma-separated text; contact_tags holds one row per tag so tag
+# filters and facet counts go through the (tag, contact_id) primary key. Every write path that
+# changes contacts.tags calls sync_contact_tags for the rows it touched (deletes cascade).
+CONTACT_TAGS_SQL = """
+CREATE TABLE IF NOT EXISTS contact_tags (
+  tag TEXT NOT NULL COLLATE NOCASE,
+  contact_id INTEGER NOT NULL,
+  PRIMARY KEY (tag, contact_id),
+  FOREIGN KEY(contact_id) REFERENCES contacts(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_contact_tags_contact ON contact_tags(contact_id);
+"""
+
+def split_tags(tags) -> list:
+    # "GRW, 2024,,grw" -> ["GRW", "2024"]: trimmed, empties dropped, one entry per tag ignoring case
+    out, seen = [], set()
+    for t in str(tags or "").split(","):
+        t = t.strip()
+        if t and t.lower() not in seen:
+            seen.add(t.lower())
+            out.append(t)
+    return out
+
+def sync_contact_tags(conn, cond: str = "", params=()) -> int:
+    # Re-derives contact_tags for the contacts matching cond (every contact when empty).
+    scope = "SELECT id FROM contacts" + where([cond] if cond else [])
+    conn.execute(f"DELETE FROM contact_tags WHERE contact_id IN ({scope})", params)
+    cur = conn.execute("SELECT id, tags FROM contacts" + where([cond, "tags != ''"] if cond else ["tags != ''"]), params)
+    return conn.executemany("INSERT OR IGNORE INTO contact_tags (tag, contact_id) VALUES (?,?)",
+                            ((t, i) for i, tags in cur for t in split_tags(tags))).rowcount
+
+def max_contact_id(conn) -> int:
+    # contacts.id is AUTOINCREMENT, so rows inserted after this call all have larger ids
+    return conn.execute("SELECT IFNULL(MAX(id), 0) FROM contacts").fetchone()[0]
+
+def backfill_contact_tags(conn, batch_size: int = 5000) -> int:
+    n, last = 0, 0
+    while True:
+        ids = [r[0] for r in conn.execute("SELECT id FROM contacts WHERE id > ? ORDER BY id LIMIT ?", (last, batch_size))]
+        if not ids:
+            return n
+        n += sync_contact_tags(conn, "id BETWEEN ? AND ?", (ids[0], ids[-1]))
+        conn.commit()
+        last = ids[-1]
+
+INSERT_CONTACT_SQL = f"INSERT INTO contacts ({','.join(CONTACT_FIELDS)},phone_key,email_key) VALUES ({','.join(['?']*(len(CONTACT_FIELDS) + 2))})"
+
+@profiled
 def insert_contact(data: dict) -> int:
-    keys = ["name","phone","email","source","interest","status","tags","assigned","notes","action_needed","action_taken","username","password"]
-    vals = [data.get(k) for k in keys]
     with get_conn() as conn:
-        cur = conn.execute(f"""
-            INSERT INTO contacts ({",".join(keys)})
-            VALUES ({",".join(["?"]*len(keys))})
-        """, vals)
+        cur = conn.execute(INSERT_CONTACT_SQL, contact_values(data))
+        sync_contact_tags(conn, "id = ?", (cur.lastrowid,))
         return cur.lastrowid
 
+@profiled
+def insert_contacts_bulk(rows, batch_size: int = 1000, progress=None) -> dict:
+    # rows: iterable of dicts keyed by CONTACT_FIELDS; rows with neither name nor phone are skipped.
+    # One connection, one transaction per batch; progress(done) is called after each commit.
+    inserted = skipped = 0
+    batch = []
+    with get_conn() as conn:
+        def flush():
+            nonlocal inserted
+            with conn:
+                before = max_contact_id(conn)
+                conn.executemany(INSERT_CONTACT_SQL, batch)
+                sync_contact_tags(conn, "id > ?", (before,))
+            inserted += len(batch)
+            batch.clear()
+            if progress:
+                progress(inserted + skipped)
+        for data in rows:
+            if not (data.get("name") or data.get("phone")):
+                skipped += 1
+                continue
+            batch.append(contact_values(data))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    return dict(inserted=inserted, skipped=skipped)
+
+def start_import(file_name: str, fingerprint: str, col_map: dict, busy=()) -> dict:
+    # Resumes the unfinished import of the same file with the same mapping, else starts a new one.
+    # busy: ids of imports something else is running (see jobs.submit_import), never resumed here.
+    mapping = json.dumps(col_map, sort_keys=True)
+    busy = list(busy)
+    with get_conn(invalidate=False) as conn:
+        row = conn.execute(f"""
+            SELECT id FROM imports WHERE fingerprint = ? AND status = 'running' AND col_map = ?
+              AND id NOT IN ({','.join('?' * len(busy))})
+            ORDER BY id DESC LIMIT 1
+        """, [fingerprint, mapping] + busy).fetchone()
+        import_id = row[0] if row else conn.execute(
+            "INSERT INTO imports (file_name, fingerprint, col_map, status) VALUES (?,?,?,'running')",
+            (file_name, fingerprint, mapping)).lastrowid
+    return fetch_import(import_id)
+
+def fetch_import(import_id: int) -> dict:
+    keys = ["id","file_name","fingerprint","col_map","status","rows_done","inserted","updated","skipped","started_at","finished_at"]
+    with get_conn() as conn:
+        row = conn.execute(f"SELECT {','.join(keys)} FROM imports WHERE id=?", (import_id,)).fetchone()
+    return dict(zip(keys, row)) if row else None
+
+def find_unfinished_import(fingerprint: str) -> dict:
+    with get_conn() as conn:
+        row = conn.execute("SELECT id FROM imports WHERE fingerprint = ? AND status = 'running' ORDER BY id DESC LIMIT 1",
+                           (fingerprint,)).fetchone()
+    return fetch_import(row[0]) if row else None
+
+@profiled
+def import_chunk(import_id: int, rows, rows_done: int, upsert: bool = False) -> dict:
+    # Inserts (or with upsert=True, upserts) one chunk of mapped rows and records rows_done (file rows
+    # consumed so far) in the same transaction, so after a crash the import resumes exactly after
+    # the last committed chunk.
+    rows = list(rows)
+    valid = [d for d in rows if d.get("name") or d.get("phone")]
+    with get_conn() as conn:
+        # the upsert reads contacts before writing them: take the write lock first, or a commit from
+        # another connection in between fails the upgrade with "database is locked" (busy_timeout
+        # doesn't retry a stale read snapshot)
+        conn.execute("BEGIN IMMEDIATE")
+        if upsert:
+            res = upsert_contacts(conn, valid)
+        else:
+            before = max_contact_id(conn)
+            conn.executemany(INSERT_CONTACT_SQL, [contact_values(d) for d in valid])
+            sync_contact_tags(conn, "id > ?", (before,))
+            res = dict(inserted=len(valid), updated=0)
+        res["skipped"] = len(rows) - len(valid)
+        conn.execute("UPDATE imports SET rows_done=?, inserted=inserted+?, updated=updated+?, skipped=skipped+? WHERE id=?",
+                     (rows_done, res["inserted"], res["updated"], res["skipped"], import_id))
+    return res
+
+def upsert_contacts(conn, rows: list) -> dict:
+    # Set-based upsert of one batch, matched on phone_key first, then email_key, through the key
+    # indexes. Matched contacts only take the non-empty values from the file, so a sheet with a few
+    # columns doesn't blank the rest; rows that match nothing are inserted. Rows are folded the way
+    # the matching will see them (later rows win): by phone key within the batch, then by email key
+    # among the rows whose phone matched no contact, and last the rows that turn out to match the
+    # same contact by phone and by email, where the contact keeps the phone it was matched on. Two
+    # rows with different phones that match different contacts are never folded, whatever email they
+    # share. The counts are of file rows, so inserted + updated is always len(rows).
+    # Plain INSERT ... ON CONFLICT would need UNIQUE indexes on the keys, which existing duplicate
+    # data (see merge_duplicates) and the Add form's manual entries are allowed to violate.
+    def fold(old, vals):
+        return [v if v not in (None, "") else o for v, o in zip(vals, old)]
+
+    folded, counts, by_phone = [], [], {}
+    for d in rows:
+        vals = contact_values(d)
+        hit = by_phone.get(vals[-2]) if vals[-2] else None
+        if hit is None:
+            if vals[-2]:
+                by_phone[vals[-2]] = len(folded)
+            folded.append(vals)
+            counts.append(1)
+        else:
+            folded[hit] = fold(folded[hit], vals)
+            counts[hit] += 1
+    cols = CONTACT_FIELDS + ["phone_key", "email_key"]
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS import_stage ({','.join(cols)}, seq INTEGER, n INTEGER, match_id INTEGER, by_phone INTEGER)")
+    conn.execute("DELETE FROM import_stage")
+    conn.executemany(f"INSERT INTO import_stage ({','.join(cols)},seq,n) VALUES ({','.join('?' * (len(cols) + 2))})",
+                     [vals + [i, n] for i, (vals, n) in enumerate(zip(folded, counts))])
+
+    phone_at = cols.index("phone")
+
+    def collapse(seqs, phone_from=None):
+        # stage rows seqs (in file order) -> one row, the last of them, holding their folded values
+        vals = folded[seqs[0]]
+        for s in seqs[1:]:
+            vals = fold(vals, folded[s])
+        if phone_from is not None:
+            vals[phone_at], vals[-2] = folded[phone_from][phone_at], folded[phone_from][-2]
+        folded[seqs[-1]], counts[seqs[-1]] = vals, sum(counts[s] for s in seqs)
+        conn.execute(f"DELETE FROM import_stage WHERE seq IN ({','.join('?' * (len(seqs) - 1))})", seqs[:-1])
+        conn.execute(f"UPDATE import_stage SET {','.join(f'{k}=?' for k in cols)}, n=? WHERE seq=?",
+                     vals + [counts[seqs[-1]], seqs[-1]])
+
+    conn.execute("""UPDATE import_stage SET match_id = (SELECT MIN(c.id) FROM contacts c WHERE c.phone_key = import_stage.phone_key)
+                    WHERE phone_key != ''""")
+    conn.execute("UPDATE import_stage SET by_phone = match_id IS NOT NULL")
+    by_email = {}
+    for seq, email_key in conn.execute("SELECT seq, email_key FROM import_stage WHERE match_id IS NULL AND email_key != '' ORDER BY seq"):
+        by_email.setdefault(email_key, []).append(seq)
+    for seqs in by_email.values():
+        if len(seqs) > 1:
+            collapse(seqs)
+    conn.execute("""UPDATE import_stage SET match_id = (SELECT MIN(c.id) FROM contacts c WHERE c.email_key = import_stage.email_key)
+                    WHERE match_id IS NULL AND email_key != ''""")
+    # one stage row per matched contact, or UPDATE ... FROM would apply an arbitrary one of them;
+    # only a phone-matched and an email-matched row can still meet here
+    groups, phone_seq = {}, {}
+    for seq, match_id, by_phone in conn.execute("SELECT seq, match_id, by_phone FROM import_stage WHERE match_id IS NOT NULL ORDER BY seq"):
+        groups.setdefault(match_id, []).append(seq)
+        if by_phone:
+            phone_seq[match_id] = seq
+    for match_id, seqs in groups.items():
+        if len(seqs) > 1:
+            collapse(seqs, phone_seq.get(match_id))
+    updated, inserted = conn.execute("""SELECT IFNULL(SUM(CASE WHEN match_id IS NOT NULL THEN n END), 0),
+                                               IFNULL(SUM(CASE WHEN match_id IS NULL THEN n END), 0) FROM import_stage""").fetchone()
+    sets = ",".join(f"{k} = CASE WHEN s.{k} != '' THEN s.{k} ELSE contacts.{k} END" for k in cols)
+    conn.execute(f"UPDATE contacts SET {sets} FROM import_stage s WHERE contacts.id = s.match_id")
+    before = max_contact_id(conn)
+    conn.execute(f"INSERT INTO contacts ({','.join(cols)}) SELECT {','.join(cols)} FROM import_stage WHERE match_id IS NULL")
+    sync_contact_tags(conn, "id > ? OR id IN (SELECT match_id FROM import_stage WHERE tags != '')", (before,))
+    return dict(inserted=inserted, updated=updated)
+
+@profiled
+def duplicate_stats() -> dict:
+    # -> number of contacts that share a phone key / an email key with an older contact
+    with get_conn() as conn:
+        phone = conn.execute("SELECT IFNULL(SUM(n - 1),0) FROM (SELECT COUNT(*) n FROM contacts WHERE phone_key != '' GROUP BY phone_key HAVING n > 1)").fetchone()[0]
+        email = conn.execute("SELECT IFNULL(SUM(n - 1),0) FROM (SELECT COUNT(*) n FROM contacts WHERE email_key != '' GROUP BY email_key HAVING n > 1)").fetchone()[0]
+    return dict(phone=phone, email=email)
+
+@profiled
+def merge_duplicates() -> dict:
+    # Folds every group of contacts sharing a phone key (then an email key) into its oldest member:
+    # the survivor's empty fields are filled from the newest duplicate that has a value, orders and
+    # activities are re-pointed to it and the duplicates are deleted. Groups come from one GROUP BY
+    # over the key index, so this is a sort of the table, not a pairwise comparison.
+    merged = 0
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")   # reads contacts before writing them, see import_chunk
+        for key in ("phone_key", "email_key"):
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS dup_map (dup_id INTEGER PRIMARY KEY, keep_id INTEGER)")
+            # the field fills look duplicates up by survivor; without this each lookup scans dup_map
+            conn.execute("CREATE INDEX IF NOT EXISTS temp.idx_dup_map_keep ON dup_map(keep_id, dup_id)")
+            conn.execute("DELETE FROM dup_map")
+            conn.execute(f"""
+                INSERT INTO dup_map (dup_id, keep_id)
+                SELECT id, keep_id FROM (
+                    SELECT id, MIN(id) OVER (PARTITION BY {key}) AS keep_id FROM contacts WHERE {key} != ''
+                ) WHERE id != keep_id
+            """)
+            fills = ",".join(f"""{k} = COALESCE(NULLIF({k},''), (
+                    SELECT d.{k} FROM dup_map m JOIN contacts d ON d.id = m.dup_id
+                    WHERE m.keep_id = contacts.id AND d.{k} != '' ORDER BY d.id DESC LIMIT 1), {k})"""
+                             for k in CONTACT_FIELDS + ["phone_key", "email_key"])
+            conn.execute(f"UPDATE contacts SET {fills} WHERE id IN (SELECT keep_id FROM dup_map)")
+            sync_contact_tags(conn, "id IN (SELECT keep_id FROM dup_map)")
+            for table in ("orders", "activities"):
+                conn.execute(f"""UPDATE {table} SET contact_id = (SELECT keep_id FROM dup_map WHERE dup_id = {table}.contact_id)
+                                 WHERE contact_id IN (SELECT dup_id FROM dup_map)""")
+            merged += conn.execute("DELETE FROM contacts WHERE id IN (SELECT dup_id FROM dup_map)").rowcount
+    return dict(merged=merged)
+
+def finish_import(import_id: int) -> dict:
+    with get_conn(invalidate=False) as conn:
+        conn.execute("UPDATE imports SET status='done', finished_at=CURRENT_TIMESTAMP WHERE id=?", (import_id,))
+    return fetch_import(import_id)
+
+# --- JOBS ---
+# One row per background job (see jobs.py). params/result are JSON; done counts the job's rows so
+# far, total is NULL until known and progress is the fraction done (NULL when it can't be told).
+# seconds accumulates running time over every attempt, rate is rows/s of the latest attempt.
+JOBS_SQL = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind TEXT NOT NULL,       -- import, export, ...
+  label TEXT,
+  params TEXT,
+  status TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done, failed, cancelled, interrupted
+  done INTEGER DEFAULT 0,
+  total INTEGER,
+  progress REAL,
+  seconds REAL DEFAULT 0,
+  rate REAL,
+  result TEXT,
+  error TEXT,
+  cancel_requested INTEGER DEFAULT 0,
+  created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  started_at TEXT,
+  finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+JOB_KEYS = ["id","kind","label","params","status","done","total","progress","seconds","rate","result","error",
+            "cancel_requested","created_at","started_at","finished_at"]
+JOB_ACTIVE = ("queued", "running")
+
+def job_dict(row) -> dict:
+    job = dict(zip(JOB_KEYS, row))
+    job["params"] = json.loads(job["params"] or "{}")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+def create_job(kind: str, label: str, params: dict) -> int:
+    with get_conn(invalidate=False) as conn:
+        return conn.execute("INSERT INTO jobs (kind, label, params) VALUES (?,?,?)",
+                            (kind, label, json.dumps(params))).lastrowid
+
+def fetch_job(job_id: int) -> dict:
+    with get_conn() as conn:
+        row = conn.execute(f"SELECT {','.join(JOB_KEYS)} FROM jobs WHERE id=?", (job_id,)).fetchone()
+    return job_dict(row) if row else None
+
+def fetch_jobs(limit: int = 20) -> list:
+    # newest first; not cached, pages poll this for progress
+    with get_conn() as conn:
+        rows = conn.execute(f"SELECT {','.join(JOB_KEYS)} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [job_dict(r) for r in rows]
+
+def update_job(job_id: int, **fields) -> bool:
+    # -> whether cancellation has been requested, so progress writes double as the cancel check
+    if "result" in fields:
+        fields["result"] = json.dumps(fields["result"])
+    with get_conn(invalidate=False) as conn:
+        if fields:
+            conn.execute(f"UPDATE jobs SET {','.join(f'{k}=?' for k in fields)} WHERE id=?", [*fields.values(), job_id])
+        row = conn.execute("SELECT cancel_requested FROM jobs WHERE id=?", (job_id,)).fetchone()
+    return bool(row and row[0])
+
+def finish_job(job_id: int, status: str, **fields):
+    update_job(job_id, status=status, **fields)
+    with get_conn(invalidate=False) as conn:
+        conn.execute("UPDATE jobs SET finished_at=CURRENT_TIMESTAMP WHERE id=?", (job_id,))
+
+def claim_job(job_id: int) -> bool:
+    # queued -> running; False when it was cancelled (or claimed) in the meantime
+    with get_conn(invalidate=False) as conn:
+        return conn.execute("""UPDATE jobs SET status='running', started_at=CURRENT_TIMESTAMP, finished_at=NULL, error=NULL, rate=NULL
+                               WHERE id=? AND status='queued'""", (job_id,)).rowcount == 1
+
+def requeue_job(job_id: int) -> bool:
+    with get_conn(invalidate=False) as conn:
+        return conn.execute("""UPDATE jobs SET status='queued', cancel_requested=0
+                               WHERE id=? AND status IN ('failed','cancelled','interrupted')""", (job_id,)).rowcount == 1
+
+def cancel_job(job_id: int):
+    # a queued job is cancelled on the spot; a running one stops at its next progress write
+    with get_conn(invalidate=False) as conn:
+        conn.execute("""UPDATE jobs SET cancel_requested=1,
+                               status=CASE status WHEN 'queued' THEN 'cancelled' ELSE status END,
+                               finished_at=CASE status WHEN 'queued' THEN CURRENT_TIMESTAMP ELSE finished_at END
+                        WHERE id=? AND status IN ('queued','running')""", (job_id,))
+
+def interrupt_jobs() -> int:
+    # jobs a previous process left queued or running; they can be resumed
+    with get_conn(invalidate=False) as conn:
+        return conn.execute("UPDATE jobs SET status='interrupted' WHERE status IN ('queued','running')").rowcount
+
+def delete_jobs(job_ids) -> int:
+    ids = list(job_ids)
+    with get_conn(invalidate=False) as conn:
+        return conn.execute(f"DELETE FROM jobs WHERE id IN ({','.join('?' * len(ids))}) AND status NOT IN ('queued','running')",
+                            ids).rowcount if ids else 0
+
+@profiled
 def update_contact(contact_id: int, data: dict):
-    keys = ["name","phone","email","source","interest","status","tags","assigned","notes","action_needed","action_taken","username","password"]
+    keys = CONTACT_FIELDS + ["phone_key", "email_key"]
     sets = ",".join([f"{k}=?" for k in keys])
-    vals = [data.get(k) for k in keys] + [contact_id]
+    vals = contact_values(data) + [contact_id]
     with get_conn() as conn:
         conn.execute(f"UPDATE contacts SET {sets} WHERE id=?", vals)
+        sync_contact_tags(conn, "id = ?", (contact_id,))
 
+@profiled
 def delete_contact(contact_id: int):
     with get_conn() as conn:
         conn.execute("DELETE FROM contacts WHERE id=?", (contact_id,))
 
-def fetch_contacts(search: str = "", status: str = "", tag: str = ""):
-    q = "SELECT id,name,phone,email,source,interest,status,tags,assigned,notes,action_needed,action_taken,username,password,created_at FROM contacts"
-    conds, params = [], []
-    if search:
-        conds.append("(name LIKE ? OR phone LIKE ? OR email LIKE ? OR interest LIKE ? OR notes LIKE ? OR action_needed LIKE ? OR action_taken LIKE ?)")
-        like = f"%{search}%"
-        params += [like, like, like, like, like, like, like]
+# --- BULK UPDATES ---
+# bulk_update_contacts() sets the columns in changes on every contact the Contacts page filters
+# match (narrowed to ids when given) with one UPDATE. The matching ids are taken first, so changing
+# the column a filter looks at (Warm -> Hot with status="Warm") can't move rows in or out half-way;
+# rows that already hold every new value are left alone. The batch is recorded as one activity with
+# no contact (type bulk_update, details = JSON of the changes, filters and counts).
+BULK_FIELDS = ["source","interest","status","tags","assigned","notes","action_needed","action_taken"]
+
+@profiled
+def bulk_update_contacts(changes: dict, search: str = "", status: str = "", tag: str = "", tag_mode: str = "all",
+                         ids=None) -> dict:
+    # -> dict(matched, updated, activity_id)
+    unknown = set(changes) - set(BULK_FIELDS)
+    if unknown:
+        raise ValueError(f"not bulk-editable: {', '.join(sorted(unknown))}")
+    join, conds, params, _ = contact_filter(search, status, tag, tag_mode)
+    if ids is not None:
+        ids = list(ids)
+        conds.append(f"c.id IN ({','.join('?' * len(ids))})" if ids else "0")
+        params += ids
+    keys = list(changes)
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")   # reads the matching ids before writing them, see import_chunk
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM bulk_ids")
+        matched = conn.execute("INSERT INTO bulk_ids SELECT c.id FROM contacts c" + join + where(conds), params).rowcount
+        updated = 0
+        if keys and matched:
+            updated = conn.execute(f"""UPDATE contacts SET {','.join(f'{k}=?' for k in keys)}
+                                       WHERE id IN (SELECT id FROM bulk_ids) AND ({' OR '.join(f'{k} IS NOT ?' for k in keys)})""",
+                                   [changes[k] for k in keys] * 2).rowcount
+            if "tags" in changes:
+                sync_contact_tags(conn, "id IN (SELECT id FROM bulk_ids)")
+        conn.execute("DELETE FROM bulk_ids")
+        activity_id = None
+        if updated:
+            filters = {k: v for k, v in dict(search=search, status=status, tag=tag, tag_mode=tag_mode if tag else "").items() if v}
+            summary = f"Bulk update of {updated} contacts: " + ", ".join(f"{k}={changes[k]!r}" for k in keys)
+            activity_id = conn.execute("INSERT INTO activities (contact_id, type, summary, details) VALUES (NULL,'bulk_update',?,?)",
+                                       (summary, json.dumps(dict(changes=changes, filters=filters, selected=len(ids) if ids is not None else None,
+                                                                 matched=matched, updated=updated)))).lastrowid
+    return dict(matched=matched, updated=updated, activity_id=activity_id)
+
+@profiled
+@cached
+def fetch_bulk_updates(limit: int = 10):
+    # newest bulk_update_contacts() batches
+    with get_conn() as conn:
+        return fetch_records(conn, """
+            SELECT id, activity_date, summary, details
+            FROM activities
+            WHERE contact_id IS NULL AND type = 'bulk_update'
+            ORDER BY activity_date DESC, id DESC
+            LIMIT ?
+        """, (limit,))
+
+CONTACT_COLUMNS = ["id","name","phone","email","source","interest","status","tags","assigned","notes","action_needed","action_taken","username","password","created_at"]
+
+# --- ROW RECORDS ---
+# Read functions return namedtuple records named after the SELECT's columns: still plain tuples
+# (same memory as sqlite3's rows, no per-row __dict__, pd.DataFrame(rows) picks up the column
+# names), but callers read r.phone instead of r[2]. One record type per distinct column list.
+@functools.lru_cache(maxsize=None)
+def record_type(fields: tuple):
+    return namedtuple("Record", fields, rename=True)
+
+def fetch_records(conn, q: str, params=()) -> list:
+    cur = conn.execute(q, params)
+    # tuple.__new__ straight from C, not namedtuple._make's Python call per row
+    make = functools.partial(tuple.__new__, record_type(tuple(d[0] for d in cur.description)))
+    return list(map(make, cur.fetchall()))
+
+def fetch_record(conn, q: str, params=()):
+    rows = fetch_records(conn, q, params)
+    return rows[0] if rows else None
+
+def contact_columns(columns=None) -> list:
+    # column projection for contact reads; None means every column in CONTACT_COLUMNS
+    if not columns:
+        return CONTACT_COLUMNS
+    unknown = [k for k in columns if k not in CONTACT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown contact column(s): {', '.join(unknown)}")
+    return list(columns)
+
+def where(conds) -> str:
+    return " WHERE " + " AND ".join(conds) if conds else ""
+
+def contact_filter(search: str = "", status: str = "", tag: str = "", tag_mode: str = "all"):
+    # -> (join, conds, params, ranked); shared by every query that takes the Contacts page filters.
+    # search uses FTS5 (prefix match, ranked by bm25) when available, else LIKE on every search field.
+    # tag is one tag or a comma-separated list, matched exactly (ignoring case) through contact_tags;
+    # tag_mode "all" wants every listed tag, "any" at least one
+    match = fts_query(search) if search and FTS_ENABLED else ""
+    join, conds, params = "", [], []
+    if match:
+        join = " JOIN contacts_fts ON contacts_fts.rowid = c.id"
+        conds.append("contacts_fts MATCH ?")
+        params.append(match)
+    elif search:
+        conds.append("(" + " OR ".join(f"c.{k} LIKE ?" for k in CONTACT_SEARCH_FIELDS) + ")")
+        params += [f"%{search}%"] * len(CONTACT_SEARCH_FIELDS)
     if status:
-        conds.append("status = ?")
+        conds.append("c.status = ?")
         params.append(status)
-    if tag:
-        conds.append("tags LIKE ?")
-        params.append(f"%{tag}%")
-    if conds:
-        q += " WHERE " + " AND ".join(conds)
-    q += " ORDER BY created_at DESC"
+    tags = split_tags(tag)
+    if tags:
+        marks = ",".join("?" * len(tags))
+        having = f" GROUP BY contact_id HAVING COUNT(*) = {len(tags)}" if tag_mode == "all" and len(tags) > 1 else ""
+        conds.append(f"c.id IN (SELECT contact_id FROM contact_tags WHERE tag IN ({marks}){having})")
+        params += tags
+    return join, conds, params, bool(match)
+
+def keyset_page(q: str, conds: list, params: list, keys: tuple, key_pos: tuple, limit: int, after=None, rank: str = None):
+    # Newest-first page of q on the two key columns (a date and the id). The cursor is the key of
+    # the last row returned, so the next page is an index seek rather than an OFFSET that re-reads
+    # every earlier page. NULL dates sort last, so they are reached after the dated rows run out.
+    # Ranked full-text results have no stable key; their cursor is a row offset into the matches.
+    # Returns (rows, next_cursor); next_cursor is None on the last page.
+    order = f" ORDER BY {keys[0]} DESC, {keys[1]} DESC LIMIT ?"
+    with get_conn() as conn:
+        if rank:
+            offset = after or 0
+            rows = fetch_records(conn, q + where(conds) + f" ORDER BY {rank}, {keys[0]} DESC, {keys[1]} DESC LIMIT ? OFFSET ?",
+                                 params + [limit + 1, offset])
+            return rows[:limit], (offset + limit if len(rows) > limit else None)
+        if after is None:
+            rows = fetch_records(conn, q + where(conds) + order, params + [limit + 1])
+        elif after[0] is None:
+            rows = fetch_records(conn, q + where(conds + [f"{keys[0]} IS NULL AND {keys[1]} < ?"]) + order,
+                                 params + [after[1], limit + 1])
+        else:
+            rows = fetch_records(conn, q + where(conds + [f"({keys[0]},{keys[1]}) < (?,?)"]) + order,
+                                 params + [after[0], after[1], limit + 1])
+            if len(rows) <= limit:
+                rows += fetch_records(conn, q + where(conds + [f"{keys[0]} IS NULL"]) + order,
+                                      params + [limit + 1 - len(rows)])
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], (last[key_pos[0]], last[key_pos[1]])
+
+def count_rows(q: str, conds: list, params: list) -> int:
+    with get_conn() as conn:
+        return conn.execute(q + where(conds), params).fetchone()[0]
+
+@profiled
+@cached
+def fetch_contacts(search: str = "", status: str = "", tag: str = "", columns: tuple = None, tag_mode: str = "all"):
+    # columns=("id","name") fetches just those (e.g. for a selectbox) instead of all 15
+    join, conds, params, ranked = contact_filter(search, status, tag, tag_mode)
+    q = "SELECT " + ",".join(f"c.{k}" for k in contact_columns(columns)) + " FROM contacts c" + join + where(conds)
+    q += " ORDER BY contacts_fts.rank, c.created_at DESC" if ranked else " ORDER BY c.created_at DESC"
     with get_conn() as conn:
-        rows = conn.execute(q, params).fetchall()
-    return rows
+        return fetch_records(conn, q, params)
 
+@profiled
+@cached
+def fetch_contacts_page(search: str = "", status: str = "", tag: str = "", limit: int = 50, after=None, columns: tuple = None,
+                        tag_mode: str = "all"):
+    # the page cursor needs id and created_at, so they are always fetched (last, if not asked for)
+    join, conds, params, ranked = contact_filter(search, status, tag, tag_mode)
+    cols = contact_columns(columns)
+    cols = cols + [k for k in ("id", "created_at") if k not in cols]
+    q = "SELECT " + ",".join(f"c.{k}" for k in cols) + " FROM contacts c" + join
+    return keyset_page(q, conds, params, ("c.created_at", "c.id"), (cols.index("created_at"), cols.index("id")),
+                       limit, after, rank="contacts_fts.rank" if ranked else None)
+
+@profiled
+@cached
+def count_contacts(search: str = "", status: str = "", tag: str = "", tag_mode: str = "all") -> int:
+    join, conds, params, _ = contact_filter(search, status, tag, tag_mode)
+    return count_rows("SELECT COUNT(*) FROM contacts c" + join, conds, params)
+
+@profiled
+@cached
+def contact_facets(search: str = "", status: str = "", tag: str = "", tag_mode: str = "all") -> dict:
+    # -> dict(statuses=[(status, n)], tags=[(tag, n)]), most contacts first. Each facet applies the
+    # other filters but not its own, so it shows what picking a different status/tag would give.
+    # One grouped query: the status branch groups on the status index, the tag branch on contact_tags.
+    sjoin, sconds, sparams, _ = contact_filter(search, "", tag, tag_mode)
+    tjoin, tconds, tparams, _ = contact_filter(search, status, "")
+    tag_source = " JOIN contacts c ON c.id = t.contact_id" + tjoin if tconds else ""
+    q = f"""SELECT 'statuses', IFNULL(c.status,''), COUNT(*) FROM contacts c{sjoin}{where(sconds)} GROUP BY c.status
+            UNION ALL
+            SELECT 'tags', t.tag, COUNT(*) FROM contact_tags t{tag_source}{where(tconds)} GROUP BY t.tag"""
+    out = dict(statuses={}, tags=[])
+    with get_conn() as conn:
+        for facet, value, n in conn.execute(q, sparams + tparams):
+            if facet == "statuses":
+                out[facet][value] = out[facet].get(value, 0) + n  # NULL and '' both count as ''
+            else:
+                out[facet].append((value, n))
+    out["statuses"] = list(out["statuses"].items())
+    for k in out:
+        out[k].sort(key=lambda r: (-r[1], r[0].lower()))
+    return out
+
+@profiled
 def insert_order(data: dict) -> int:
     keys = ["contact_id","product","quantity","amount","status","pop_url","notes"]
     vals = [data.get(k) for k in keys]
@@ -138,66 +1265,371 @@ def insert_order(data: dict) -> int:
         """, vals)
         return cur.lastrowid
 
-def fetch_orders(contact_id: int = None):
-    q = """SELECT o.id, o.contact_id, c.name, o.product, o.quantity, o.amount, o.status, o.pop_url, o.notes, o.created_at
+ORDER_SELECT = """SELECT o.id, o.contact_id, c.name AS contact, o.product, o.quantity, o.amount, o.status, o.pop_url, o.notes, o.created_at
            FROM orders o
            LEFT JOIN contacts c ON c.id = o.contact_id"""
+
+@profiled
+@cached
+def fetch_orders(contact_id: int = None):
+    q = ORDER_SELECT
     params = []
     if contact_id:
         q += " WHERE o.contact_id = ?"
         params.append(contact_id)
     q += " ORDER BY o.created_at DESC"
     with get_conn() as conn:
-        rows = conn.execute(q, params).fetchall()
-    return rows
+        return fetch_records(conn, q, params)
+
+@profiled
+@cached
+def fetch_orders_page(contact_id: int = None, limit: int = 50, after=None):
+    conds, params = (["o.contact_id = ?"], [contact_id]) if contact_id else ([], [])
+    return keyset_page(ORDER_SELECT, conds, params, ("o.created_at", "o.id"), (9, 0), limit, after)
+
+@profiled
+@cached
+def count_orders(contact_id: int = None) -> int:
+    conds, params = (["o.contact_id = ?"], [contact_id]) if contact_id else ([], [])
+    return count_rows("SELECT COUNT(*) FROM orders o", conds, params)
 
+@profiled
 def insert_campaign(data: dict) -> int:
     keys = ["date","channel","name","audience","message","outcome","notes"]
     vals = [data.get(k) for k in keys]
     with get_conn() as conn:
+        # date=None means "now", like the column default (the app always passes None)
         cur = conn.execute(f"""
             INSERT INTO campaigns ({",".join(keys)})
-            VALUES ({",".join(["?"]*len(keys))})
+            VALUES (COALESCE(?, CURRENT_TIMESTAMP),{",".join(["?"]*(len(keys) - 1))})
         """, vals)
         return cur.lastrowid
 
-def fetch_campaigns(search: str = ""):
-    q = "SELECT id, date, channel, name, audience, message, outcome, notes FROM campaigns"
-    params = []
+CAMPAIGN_SELECT = "SELECT c.id, c.date, c.channel, c.name, c.audience, c.message, c.outcome, c.notes FROM campaigns c"
+
+def campaign_filter(search: str = ""):
+    match = fts_query(search) if search and FTS_ENABLED else ""
+    if match:
+        return " JOIN campaigns_fts ON campaigns_fts.rowid = c.id", ["campaigns_fts MATCH ?"], [match], True
     if search:
-        q += " WHERE (name LIKE ? OR audience LIKE ? OR message LIKE ? OR notes LIKE ?)"
-        like = f"%{search}%"
-        params += [like, like, like, like]
-    q += " ORDER BY date DESC"
+        return "", ["(" + " OR ".join(f"c.{k} LIKE ?" for k in CAMPAIGN_SEARCH_FIELDS) + ")"], [f"%{search}%"] * len(CAMPAIGN_SEARCH_FIELDS), False
+    return "", [], [], False
+
+@profiled
+@cached
+def fetch_campaigns(search: str = ""):
+    join, conds, params, ranked = campaign_filter(search)
+    q = CAMPAIGN_SELECT + join + where(conds)
+    q += " ORDER BY campaigns_fts.rank, c.date DESC" if ranked else " ORDER BY c.date DESC"
+    with get_conn() as conn:
+        return fetch_records(conn, q, params)
+
+@profiled
+@cached
+def fetch_campaigns_page(search: str = "", limit: int = 50, after=None):
+    join, conds, params, ranked = campaign_filter(search)
+    return keyset_page(CAMPAIGN_SELECT + join, conds, params, ("c.date", "c.id"), (1, 0), limit, after,
+                       rank="campaigns_fts.rank" if ranked else None)
+
+@profiled
+@cached
+def count_campaigns(search: str = "") -> int:
+    join, conds, params, _ = campaign_filter(search)
+    return count_rows("SELECT COUNT(*) FROM campaigns c" + join, conds, params)
+
+@profiled
+def insert_campaign_batch(data: dict, activities, type: str = "whatsapp", summary: str = "Sent template") -> dict:
+    # One transaction for a whole campaign send: the campaigns row plus one activity per
+    # (contact_id, details) pair. activities may be a generator; it is consumed inside the
+    # transaction, so nothing is logged if rendering fails part-way.
+    keys = ["date","channel","name","audience","message","outcome","notes"]
     with get_conn() as conn:
-        rows = conn.execute(q, params).fetchall()
-    return rows
+        campaign_id = conn.execute(f"""
+            INSERT INTO campaigns ({",".join(keys)})
+            VALUES (COALESCE(?, CURRENT_TIMESTAMP),{",".join(["?"]*(len(keys) - 1))})
+        """, [data.get(k) for k in keys]).lastrowid
+        cur = conn.executemany(
+            "INSERT INTO activities (contact_id, type, summary, details, campaign_id) VALUES (?,?,?,?,?)",
+            ((contact_id, type, summary, details, campaign_id) for contact_id, details in activities))
+        logged = cur.rowcount
+    return dict(campaign_id=campaign_id, logged=logged)
 
+@profiled
 def insert_activity(data: dict) -> int:
-    keys = ["contact_id","activity_date","type","summary","details"]
+    keys = ["contact_id","activity_date","type","summary","details","campaign_id"]
     vals = [data.get(k) for k in keys]
     with get_conn() as conn:
+        # activity_date=None means "now", like the column default
         cur = conn.execute(f"""
             INSERT INTO activities ({",".join(keys)})
-            VALUES ({",".join(["?"]*len(keys))})
+            VALUES (?,COALESCE(?, CURRENT_TIMESTAMP),{",".join(["?"]*(len(keys) - 2))})
         """, vals)
         return cur.lastrowid
 
+@profiled
+@cached
 def fetch_activities(contact_id: int):
     with get_conn() as conn:
-        rows = conn.execute("""
+        return fetch_records(conn, """
             SELECT id, activity_date, type, summary, details
             FROM activities
             WHERE contact_id = ?
             ORDER BY activity_date DESC
-        """, (contact_id,)).fetchall()
-    return rows
+        """, (contact_id,))
+
+@profiled
+@cached
+def fetch_contact(contact_id: int, columns: tuple = None):
+    with get_conn() as conn:
+        return fetch_record(conn, "SELECT " + ",".join(contact_columns(columns)) + " FROM contacts WHERE id = ?", (contact_id,))
 
+# --- CONTACT TIMELINE ---
+# Everything that happened to one contact, newest first: activities (campaign sends show as
+# 'campaign') and orders. Each source is read through its (contact_id, date) index as two
+# branches -- dated rows by keyset seek, then rows with no date -- and one UNION ALL merges
+# the at-most-limit rows each branch returns. Rows: (src, id, at, kind, title, summary, details, amount);
+# the cursor is (at, src, id) of the last row, ordered by at DESC (NULL last), src DESC, id DESC.
+TIMELINE_SOURCES = [
+    ("a", "activities x LEFT JOIN campaigns cp ON cp.id = x.campaign_id", "x.activity_date",
+     "CASE WHEN x.campaign_id IS NULL THEN 'activity' ELSE 'campaign' END AS kind, "
+     "CASE WHEN x.campaign_id IS NULL THEN x.type ELSE 'Campaign: ' || IFNULL(cp.name,'#' || x.campaign_id) END AS title, "
+     "x.summary AS summary, x.details AS details, NULL AS amount"),
+    ("o", "orders x", "x.created_at",
+     "'order', x.product, x.status, x.notes, x.amount"),
+]
+
+@profiled
+@cached
+def fetch_timeline(contact_id: int, limit: int = 50, after=None):
+    branches, params = [], []
+    for src, source, date_col, cols in TIMELINE_SOURCES:
+        select = f"SELECT '{src}' AS src, x.id AS id, {date_col} AS at, {cols} FROM {source} WHERE x.contact_id = ?"
+        if after is None or after[0] is not None:
+            cond, p = (f" AND ({date_col}, '{src}', x.id) < (?, ?, ?)", list(after)) if after else (f" AND {date_col} IS NOT NULL", [])
+            branches.append(f"SELECT * FROM ({select}{cond} ORDER BY {date_col} DESC, x.id DESC LIMIT ?)")
+            params += [contact_id, *p, limit + 1]
+        cond, p = (f" AND ('{src}', x.id) < (?, ?)", [after[1], after[2]]) if after and after[0] is None else ("", [])
+        branches.append(f"SELECT * FROM ({select} AND {date_col} IS NULL{cond} ORDER BY x.id DESC LIMIT ?)")
+        params += [contact_id, *p, limit + 1]
+    q = "SELECT * FROM (" + " UNION ALL ".join(branches) + ") ORDER BY at IS NULL, at DESC, src DESC, id DESC LIMIT ?"
+    with get_conn() as conn:
+        rows = fetch_records(conn, q, params + [limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], (last.at, last.src, last.id)
+
+@profiled
+@cached
+def count_timeline(contact_id: int) -> int:
+    with get_conn() as conn:
+        return conn.execute("""
+            SELECT (SELECT COUNT(*) FROM activities WHERE contact_id = ?) + (SELECT COUNT(*) FROM orders WHERE contact_id = ?)
+        """, (contact_id, contact_id)).fetchone()[0]
+
+@profiled
+@cached
 def kpis():
     with get_conn() as conn:
-        total_contacts = conn.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
-        customers = conn.execute("SELECT COUNT(*) FROM contacts WHERE status='Customer'").fetchone()[0]
-        hot = conn.execute("SELECT COUNT(*) FROM contacts WHERE status='Hot'").fetchone()[0]
-        orders = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
-        revenue = conn.execute("SELECT IFNULL(SUM(amount),0) FROM orders WHERE status IN ('Paid','Delivered','Shipped')").fetchone()[0]
-    return dict(total_contacts=total_contacts, customers=customers, hot=hot, orders=orders, revenue=revenue)
+        contacts = dict(conn.execute("SELECT status, n FROM kpi_contacts WHERE day='*'").fetchall())
+        orders = conn.execute("SELECT status, n, amount FROM kpi_orders WHERE day='*'").fetchall()
+    return dict(
+        total_contacts=sum(contacts.values()),
+        customers=contacts.get("Customer", 0),
+        hot=contacts.get("Hot", 0),
+        orders=sum(n for _, n, _ in orders),
+        revenue=sum(amount for status, _, amount in orders if status in REVENUE_STATUSES),
+    )
+
+@profiled
+@cached
+def kpi_series(since: str = ""):
+    # per-day rows from the KPI tables, oldest first (since: 'YYYY-MM-DD', inclusive)
+    # -> (revenue rows [(day, orders, revenue)], signup rows [(day, contacts, customers)])
+    revenue_in = ",".join("?" * len(REVENUE_STATUSES))
+    with get_conn() as conn:
+        revenue = conn.execute(f"""
+            SELECT day, SUM(n), SUM(CASE WHEN status IN ({revenue_in}) THEN amount ELSE 0 END)
+            FROM kpi_orders WHERE day >= ? AND day != '*'
+            GROUP BY day ORDER BY day
+        """, (*REVENUE_STATUSES, since or "0")).fetchall()
+        signups = conn.execute("""
+            SELECT day, SUM(n), SUM(CASE WHEN status='Customer' THEN n ELSE 0 END)
+            FROM kpi_contacts WHERE day >= ? AND day != '*'
+            GROUP BY day ORDER BY day
+        """, (since or "0",)).fetchall()
+    return revenue, signups
+
+@profiled
+def rebuild_kpis(conn=None) -> list:
+    # Recomputes the KPI tables from contacts/orders and returns the rows that had drifted
+    # as [(table, day, status, stored, recomputed)] -- empty when the triggers kept them exact.
+    if conn is None:
+        with get_conn() as conn:
+            return rebuild_kpis(conn)
+    before = {("kpi_contacts", d, st): (n,) for d, st, n in conn.execute("SELECT day, status, n FROM kpi_contacts WHERE n != 0")}
+    before.update({("kpi_orders", d, st): (n, round(a, 2)) for d, st, n, a in conn.execute("SELECT day, status, n, amount FROM kpi_orders WHERE n != 0")})
+    conn.execute("DELETE FROM kpi_contacts")
+    conn.execute("DELETE FROM kpi_orders")
+    conn.execute("""
+        INSERT INTO kpi_contacts(day, status, n)
+        SELECT IFNULL(date(created_at),''), IFNULL(status,''), COUNT(*) FROM contacts GROUP BY 1, 2
+        UNION ALL
+        SELECT '*', IFNULL(status,''), COUNT(*) FROM contacts GROUP BY 2
+    """)
+    conn.execute("""
+        INSERT INTO kpi_orders(day, status, n, amount)
+        SELECT IFNULL(date(created_at),''), IFNULL(status,''), COUNT(*), IFNULL(SUM(amount),0) FROM orders GROUP BY 1, 2
+        UNION ALL
+        SELECT '*', IFNULL(status,''), COUNT(*), IFNULL(SUM(amount),0) FROM orders GROUP BY 2
+    """)
+    after = {("kpi_contacts", d, st): (n,) for d, st, n in conn.execute("SELECT day, status, n FROM kpi_contacts")}
+    after.update({("kpi_orders", d, st): (n, round(a, 2)) for d, st, n, a in conn.execute("SELECT day, status, n, amount FROM kpi_orders")})
+    return [(*k, before.get(k), after.get(k)) for k in sorted(before.keys() | after.keys()) if before.get(k) != after.get(k)]
+
+# --- EXPORT ---
+# kind -> (select, order). Contacts come out in Contacts page order so the created_at indexes serve
+# the filters without a sort; the other tables are a plain rowid walk.
+EXPORT_SELECTS = {
+    "contacts": ("SELECT " + ",".join(f"c.{k}" for k in CONTACT_COLUMNS) + " FROM contacts c", "c.created_at DESC, c.id DESC"),
+    "orders": (ORDER_SELECT, "o.id"),
+    "campaigns": (CAMPAIGN_SELECT, "c.id"),
+    "activities": ("""SELECT a.id, a.contact_id, c.name AS contact, a.activity_date, a.type, a.summary, a.details
+           FROM activities a
+           LEFT JOIN contacts c ON c.id = a.contact_id""", "a.id"),
+}
+
+def iter_export(kind: str, search: str = "", status: str = "", tag: str = "", chunk_size: int = 1000, tag_mode: str = "all"):
+    # Yields lists of up to chunk_size rows straight off one cursor, so memory use does not grow
+    # with the table. search/status/tag apply to contacts only, with the Contacts page semantics.
+    select, order = EXPORT_SELECTS[kind]
+    join, conds, params = "", [], []
+    if kind == "contacts":
+        join, conds, params, _ = contact_filter(search, status, tag, tag_mode)
+    with get_conn() as conn:
+        cur = conn.execute(select + join + where(conds) + f" ORDER BY {order}", params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+@profiled
+@cached
+def count_export(kind: str, search: str = "", status: str = "", tag: str = "", tag_mode: str = "all") -> int:
+    # rows iter_export() will yield, for export progress
+    if kind == "contacts":
+        return count_contacts(search, status, tag, tag_mode)
+    if kind not in EXPORT_SELECTS:
+        raise KeyError(kind)
+    with get_conn() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {kind}").fetchone()[0]
+
+# --- QUERY PLAN DIAGNOSTICS ---
+# Every read path in this module, with the argument combinations the app uses.
+# Add a probe here whenever a new query is added so check_query_plans() covers it.
+# QUERY_PLAN_ALLOWED_SCANS lists, per probe, the plan lines known to be needed (ordering full-text
+# matches by rank, merging the timeline's already-limited branches, sorting or grouping the contacts
+# a tag filter found through contact_tags, counting every tag for the unfiltered facets -- a walk of
+# contact_tags' primary key, already in tag order -- the exports' and the newest jobs' rowid walks).
+# Each entry excuses one matching line per statement; anything else in the same plan is still checked.
+QUERY_PLAN_PROBES = [
+    ("fetch_contacts", lambda: fetch_contacts()),
+    ("fetch_contacts(status)", lambda: fetch_contacts(status="Hot")),
+    ("fetch_contacts(search)", lambda: fetch_contacts(search="luna")),
+    ("fetch_contacts(tag)", lambda: fetch_contacts(tag="GRW")),
+    ("fetch_contacts(status+tag)", lambda: fetch_contacts(status="Hot", tag="GRW")),
+    ("fetch_contacts(tags all)", lambda: fetch_contacts(tag="GRW,VIP")),
+    ("fetch_contacts(tags any)", lambda: fetch_contacts(tag="GRW,VIP", tag_mode="any")),
+    ("fetch_contacts_page(tag)", lambda: fetch_contacts_page(tag="GRW", after=("2024-01-01 00:00:00", 10))),
+    ("count_contacts(tag)", lambda: count_contacts(tag="GRW")),
+    ("contact_facets", lambda: contact_facets()),
+    ("contact_facets(status+tag)", lambda: contact_facets(status="Hot", tag="GRW")),
+    ("fetch_contacts_page", lambda: fetch_contacts_page(after=("2024-01-01 00:00:00", 10))),
+    ("fetch_contacts_page(status)", lambda: fetch_contacts_page(status="Hot", after=("2024-01-01 00:00:00", 10))),
+    ("fetch_contacts_page(null)", lambda: fetch_contacts_page(after=(None, 10))),
+    ("count_contacts", lambda: count_contacts()),
+    ("count_contacts(status)", lambda: count_contacts(status="Hot")),
+    ("fetch_orders", lambda: fetch_orders()),
+    ("fetch_orders_page", lambda: fetch_orders_page(after=("2024-01-01 00:00:00", 10))),
+    ("fetch_orders_page(contact)", lambda: fetch_orders_page(contact_id=1, after=("2024-01-01 00:00:00", 10))),
+    ("count_orders", lambda: count_orders()),
+    ("fetch_orders(contact)", lambda: fetch_orders(contact_id=1)),
+    ("fetch_campaigns", lambda: fetch_campaigns()),
+    ("fetch_campaigns(search)", lambda: fetch_campaigns("luna")),
+    ("fetch_campaigns_page", lambda: fetch_campaigns_page(after=("2024-01-01 00:00:00", 10))),
+    ("count_campaigns", lambda: count_campaigns()),
+    ("fetch_activities", lambda: fetch_activities(1)),
+    ("fetch_bulk_updates", lambda: fetch_bulk_updates()),
+    ("fetch_contact", lambda: fetch_contact(1)),
+    ("fetch_timeline", lambda: fetch_timeline(1)),
+    ("fetch_timeline(dated)", lambda: fetch_timeline(1, after=("2024-01-01 00:00:00", "o", 10))),
+    ("fetch_timeline(undated)", lambda: fetch_timeline(1, after=(None, "o", 10))),
+    ("count_timeline", lambda: count_timeline(1)),
+    ("iter_export(contacts)", lambda: list(iter_export("contacts", status="Hot"))),
+    ("iter_export(orders)", lambda: list(iter_export("orders"))),
+    ("iter_export(campaigns)", lambda: list(iter_export("campaigns"))),
+    ("iter_export(activities)", lambda: list(iter_export("activities"))),
+    ("count_export(activities)", lambda: count_export("activities")),
+    ("fetch_jobs", lambda: fetch_jobs()),
+    ("duplicate_stats", lambda: duplicate_stats()),
+    ("kpis", lambda: kpis()),
+    ("kpi_series", lambda: kpi_series("2024-01-01")),
+]
+ORDER_SORT, GROUP_SORT = "USE TEMP B-TREE FOR ORDER BY", "USE TEMP B-TREE FOR GROUP BY"
+QUERY_PLAN_ALLOWED_SCANS = {
+    "fetch_contacts(search)": [ORDER_SORT],
+    "fetch_campaigns(search)": [ORDER_SORT],
+    "fetch_contacts(tag)": [ORDER_SORT],
+    "fetch_contacts(tags all)": [GROUP_SORT, ORDER_SORT],
+    "fetch_contacts(tags any)": [ORDER_SORT],
+    "fetch_contacts_page(tag)": [ORDER_SORT],
+    "contact_facets": ["SCAN t"],
+    "contact_facets(status+tag)": [GROUP_SORT, GROUP_SORT],
+    "iter_export(orders)": ["SCAN o"],
+    "iter_export(campaigns)": ["SCAN c"],
+    "iter_export(activities)": ["SCAN a"],
+    "fetch_jobs": ["SCAN jobs"],
+    "fetch_timeline": [ORDER_SORT],
+    "fetch_timeline(dated)": [ORDER_SORT],
+    "fetch_timeline(undated)": [ORDER_SORT],
+}
+
+def explain(sql: str, params=()):
+    with get_conn() as conn:
+        return [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+def plan_problems(plan) -> list:
+    # a bare "SCAN table" (no index) or a temp B-tree sort means the query grows with the table;
+    # scanning a subquery's own (already index-driven) result or a constant row is fine
+    out = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and "INDEX" not in detail and not detail.startswith(("SCAN (subquery", "SCAN CONSTANT ROW")):
+            out.append(detail)
+        elif "USE TEMP B-TREE" in detail:
+            out.append(detail)
+    return out
+
+def check_query_plans(probes=None) -> list:
+    # Runs each probe with SQL tracing on, EXPLAINs every SELECT it issued and returns
+    # [dict(probe, sql, plan, problems)]; problems leaves out the probe's allowed plan lines.
+    global _trace_callback
+    results = []
+    for label, probe in (probes or QUERY_PLAN_PROBES):
+        seen = []
+        clear_cache()
+        _trace_callback = seen.append
+        try:
+            probe()
+        finally:
+            _trace_callback = None
+        for sql in seen:
+            if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue
+            plan = explain(sql)
+            problems = plan_problems(plan)
+            for detail in QUERY_PLAN_ALLOWED_SCANS.get(label, ()):
+                if detail in problems:
+                    problems.remove(detail)
+            results.append(dict(probe=label, sql=" ".join(sql.split()), plan=plan, problems=problems))
+    return results
@@ -0,0 +1,53 @@
+import csv
+import io
+
+from db import iter_export
+
+# Streaming export: rows go from a SQLite cursor through the CSV writer (or openpyxl's write-only
+# workbook) a chunk at a time, so no full copy of the table is ever held in memory.
+EXPORT_COLUMNS = {
+    "contacts": ["ID","Name","Phone","Email","Source","Interest","Status","Tags","Assigned","Notes","ActionNeeded","ActionTaken","Username","Password","Created"],
+    "orders": ["ID","ContactID","Contact","Product","Qty","Amount","Status","POP","Notes","Created"],
+    "campaigns": ["ID","Date","Channel","Name","Audience","Message","Outcome","Notes"],
+    "activities": ["ID","ContactID","Contact","Date","Type","Summary","Details"],
+}
+
+def csv_chunks(kind: str, chunk_size: int = 1000, progress=None, **filters):
+    # -> utf-8 encoded CSV, one bytes object per chunk of rows (header first);
+    # progress(rows_so_far) after every chunk
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(EXPORT_COLUMNS[kind])
+    n = 0
+    for rows in iter_export(kind, chunk_size=chunk_size, **filters):
+        w.writerows(rows)
+        n += len(rows)
+        if progress:
+            progress(n)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def write_csv(kind: str, out, progress=None, **filters) -> int:
+    # out: binary file object; returns bytes written
+    n = 0
+    for chunk in csv_chunks(kind, progress=progress, **filters):
+        n += out.write(chunk)
+    return n
+
+def write_xlsx(kind: str, out, progress=None, **filters):
+    # write_only mode streams rows to disk instead of building the sheet in memory
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(kind)
+    ws.append(EXPORT_COLUMNS[kind])
+    n = 0
+    for rows in iter_export(kind, **filters):
+        for r in rows:
+            ws.append(list(r))
+        n += len(rows)
+        if progress:
+            progress(n)
+    wb.save(out)
@@ -0,0 +1,111 @@
+import hashlib
+from itertools import islice
+
+import pandas as pd
+
+from db import CONTACT_FIELDS, start_import, fetch_import, import_chunk, finish_import
+
+# Streaming contact import: the upload is read CHUNK_SIZE rows at a time (CSV via pandas
+# chunksize, XLSX via openpyxl read-only rows) and each chunk is committed on its own together
+# with the import's progress, so memory stays flat and an interrupted import can be resumed.
+CHUNK_SIZE = 5000
+
+def fingerprint(f) -> str:
+    h = hashlib.sha1()
+    f.seek(0)
+    for block in iter(lambda: f.read(1 << 20), b""):
+        h.update(block)
+    f.seek(0)
+    return h.hexdigest()
+
+def file_size(f) -> int:
+    f.seek(0, 2)
+    size = f.tell()
+    f.seek(0)
+    return size
+
+def xlsx_cell(v) -> str:
+    if v is None:
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+def dedup_header(names: list) -> list:
+    # repeated column names get .1, .2, ... the way pandas.read_csv names them (Name, Name.1),
+    # skipping suffixes the header already has, so XLSX and CSV uploads of a sheet map the same
+    # and the DataFrame's columns are unique
+    given, counts, out = set(names), {}, []
+    for col in names:
+        base, n = col, counts.get(col, 0)
+        while n > 0:
+            counts[base] = n + 1
+            col = f"{base}.{n}"
+            n = n + 1 if col in given else counts.get(col, 0)
+        counts[col] = n + 1
+        out.append(col)
+    return out
+
+def iter_chunks(f, name: str, chunk_size: int = CHUNK_SIZE):
+    # -> (DataFrame of str/None cells, fraction of the file read so far or None)
+    f.seek(0)
+    if name.lower().endswith(".csv"):
+        size = file_size(f) or 1
+        # dtype=str keeps phone numbers' leading zeros and types stable across chunks
+        # the with-block matters: a reader dropped mid-file (read_preview) would otherwise close f
+        with pd.read_csv(f, chunksize=chunk_size, dtype=str) as reader:
+            for chunk in reader:
+                yield chunk, min(f.tell() / size, 1.0)
+        return
+    from openpyxl import load_workbook
+    wb = load_workbook(f, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        rows = ws.iter_rows(values_only=True)
+        header = dedup_header([str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(next(rows, ()))])
+        width, total, done = len(header), ws.max_row, 1
+        while True:
+            batch = [[xlsx_cell(v) for v in r[:width]] + [None] * (width - len(r)) for r in islice(rows, chunk_size)]
+            if not batch:
+                break
+            done += len(batch)
+            yield pd.DataFrame(batch, columns=header), (min(done / total, 1.0) if total else None)
+    finally:
+        wb.close()
+
+def read_preview(f, name: str, n: int = 5) -> pd.DataFrame:
+    # header + first n rows only; used to show the preview and guess the column mapping
+    chunk, _ = next(iter_chunks(f, name, chunk_size=n), (pd.DataFrame(), None))
+    f.seek(0)
+    return chunk
+
+def guess_mapping(columns) -> dict:
+    return {f: next((c for c in columns if str(c).lower().strip().replace(" ","") == f.replace("_","")), "--")
+            for f in CONTACT_FIELDS}
+
+def map_import_columns(df: pd.DataFrame, col_map: dict) -> pd.DataFrame:
+    # unmapped fields and empty cells become "", everything else str
+    out = pd.DataFrame(index=df.index)
+    for f, col in col_map.items():
+        out[f] = df[col].where(df[col].notna(), "").astype(str) if col in df.columns else ""
+    return out
+
+def run_import(f, name: str, col_map: dict, chunk_size: int = CHUNK_SIZE, progress=None, upsert: bool = False,
+               import_id: int = None) -> dict:
+    # progress(rows_done, fraction_or_None) after every committed chunk; returns the imports row.
+    # upsert=True updates contacts that match on phone/email instead of adding them again.
+    # import_id continues that imports row (started by the caller) instead of looking one up.
+    imp = fetch_import(import_id) if import_id is not None else start_import(name, fingerprint(f), col_map)
+    resume_at, done = imp["rows_done"], 0
+    for chunk, fraction in iter_chunks(f, name, chunk_size):
+        if done + len(chunk) <= resume_at:
+            done += len(chunk)
+            continue
+        if done < resume_at:
+            chunk = chunk.iloc[resume_at - done:]
+            done = resume_at
+        done += len(chunk)
+        import_chunk(imp["id"], map_import_columns(chunk, col_map).to_dict("records"), done, upsert=upsert)
+        if progress:
+            progress(done, fraction)
+    return finish_import(imp["id"])
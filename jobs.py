@@ -0,0 +1,210 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import db
+from db import JOB_ACTIVE, create_job, fetch_job, fetch_jobs, update_job, finish_job, claim_job, requeue_job, interrupt_jobs, delete_jobs, count_export, count_contacts, bulk_update_contacts, start_import
+from exporter import write_csv, write_xlsx
+from importer import fingerprint, run_import
+
+# Background jobs: long imports, exports and bulk updates run on a small thread pool instead of in
+# the Streamlit script run, so a rerun or a closed tab no longer abandons them part-way. Each job is
+# a row in the jobs table that its worker keeps up to date (at most every JOB_PROGRESS_INTERVAL
+# seconds); pages poll fetch_jobs() for progress and throughput. db.cancel_job() flags a job, which
+# stops at its next progress write; resume_job() re-queues a cancelled, failed or interrupted job. Imports
+# pick up after their last committed chunk (see importer.run_import), exports start over. Jobs a
+# previous process left queued or running are marked interrupted by recover_jobs().
+# Threads rather than processes: SQLite and pandas release the GIL for the heavy parts, and the data
+# a job writes bumps db's data version, so cached reads in the app see it. The job rows themselves
+# are written without invalidating (see db.get_conn), so progress updates leave the cache alone.
+JOB_WORKERS = 2
+JOB_PROGRESS_INTERVAL = 0.5
+JOB_KINDS = {}   # kind -> fn(ctx, **params) -> JSON-able result
+
+_executor = None
+_executor_lock = threading.Lock()
+_submit_lock = threading.Lock()   # picking an imports row and queueing the job that runs it
+_recovered = set()
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    # handed to the job function; progress() persists how far it got and raises JobCancelled
+    # once db.cancel_job() has been called for the job
+    def __init__(self, job: dict):
+        self.id = job["id"]
+        self.done = self.start_done = job["done"] or 0
+        self.total = job["total"]
+        self.seconds = job["seconds"] or 0.0
+        self.started = time.perf_counter()
+        self.written = 0.0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def advance(self, done: int, total: int = None):
+        # records progress without writing it or checking for a cancel: for the last step of work
+        # that has already committed, which run_job's finish_job() then writes
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    def progress(self, done: int, total: int = None, fraction: float = None, force: bool = False):
+        self.advance(done, total)
+        if fraction is None and self.total:
+            fraction = min(done / self.total, 1.0)
+        if not force and time.perf_counter() - self.written < JOB_PROGRESS_INTERVAL:
+            return
+        self.written = time.perf_counter()
+        if update_job(self.id, **self.state(), progress=fraction):
+            raise JobCancelled()
+
+    def state(self) -> dict:
+        elapsed = self.elapsed()
+        rate = (self.done - self.start_done) / elapsed if elapsed > 0 else None
+        return dict(done=self.done, total=self.total, seconds=self.seconds + elapsed, rate=rate)
+
+def job(kind: str):
+    def register(fn):
+        JOB_KINDS[kind] = fn
+        return fn
+    return register
+
+def job_dir() -> Path:
+    # uploads waiting to be imported and finished exports, next to the database
+    path = Path(db.DB_PATH).parent / "jobs"
+    path.mkdir(exist_ok=True)
+    return path
+
+def executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="crm-job")
+        return _executor
+
+def run_job(job_id: int):
+    if not claim_job(job_id):
+        return
+    job = fetch_job(job_id)
+    ctx = JobContext(job)
+    try:
+        result = JOB_KINDS[job["kind"]](ctx, **job["params"])
+    except JobCancelled:
+        finish_job(job_id, "cancelled", **ctx.state())
+    except Exception as e:
+        finish_job(job_id, "failed", **ctx.state(), error=f"{type(e).__name__}: {e}")
+    else:
+        finish_job(job_id, "done", **ctx.state(), progress=1.0, result=result)
+
+def submit_job(kind: str, label: str, params: dict) -> int:
+    if kind not in JOB_KINDS:
+        raise KeyError(kind)
+    job_id = create_job(kind, label, params)
+    executor().submit(run_job, job_id)
+    return job_id
+
+def resume_job(job_id: int) -> bool:
+    # refused while another job is running the same imports row (see submit_import)
+    with _submit_lock:
+        job = fetch_job(job_id)
+        if job is None or job["params"].get("import_id") in active_imports() or not requeue_job(job_id):
+            return False
+    executor().submit(run_job, job_id)
+    return True
+
+def recover_jobs() -> int:
+    # once per process and database, before any job is submitted: nothing is running yet, so
+    # queued/running rows are leftovers of a stopped process
+    key = str(db.DB_PATH)
+    with _executor_lock:
+        if key in _recovered:
+            return 0
+        _recovered.add(key)
+    return interrupt_jobs()
+
+def job_files(job: dict) -> list:
+    paths = [job["params"].get("path"), (job["result"] or {}).get("path")]
+    return [p for p in paths if p and Path(p).parent == job_dir()]
+
+def remove_files(paths, skip_job: int = None):
+    # deletes job files that no job (but skip_job) refers to; jobs submitted before uploads got a
+    # file each may still share one
+    kept = {p for j in fetch_jobs(limit=-1) if j["id"] != skip_job for p in job_files(j)}
+    for p in paths:
+        if p not in kept and os.path.exists(p):
+            os.remove(p)
+
+def clear_jobs(jobs) -> int:
+    # deletes finished jobs and the files they own
+    jobs = [j for j in jobs if j["status"] not in JOB_ACTIVE]
+    n = delete_jobs(j["id"] for j in jobs)
+    remove_files([p for j in jobs for p in job_files(j)])
+    return n
+
+# --- JOB KINDS ---
+
+def active_imports() -> set:
+    # ids of the imports rows that queued or running import jobs own
+    return {j["params"].get("import_id") for j in fetch_jobs(limit=-1)
+            if j["kind"] == "import" and j["status"] in JOB_ACTIVE} - {None}
+
+def submit_import(f, name: str, col_map: dict, upsert: bool = False) -> int:
+    # Each job gets its own copy of the upload under job_dir(), removed once the import is done,
+    # and its own imports row: an earlier unfinished import of the file is continued unless an
+    # active job already owns it, in which case this one starts afresh instead of sharing it.
+    fd, path = tempfile.mkstemp(dir=job_dir(), prefix="upload-", suffix=Path(name).suffix.lower())
+    f.seek(0)
+    with os.fdopen(fd, "wb") as out:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            out.write(block)
+    f.seek(0)
+    with _submit_lock:
+        imp = start_import(name, fingerprint(f), col_map, busy=active_imports())
+        return submit_job("import", f"Import {name}", dict(path=path, name=name, col_map=col_map, upsert=upsert,
+                                                           import_id=imp["id"]))
+
+@job("import")
+def import_job(ctx: JobContext, path: str, name: str, col_map: dict, upsert: bool = False, import_id: int = None) -> dict:
+    with open(path, "rb") as f:
+        res = run_import(f, name, col_map, upsert=upsert, import_id=import_id,
+                         progress=lambda n, frac: ctx.progress(n, fraction=frac))
+    remove_files([path], skip_job=ctx.id)
+    return res
+
+EXPORT_FORMATS = {"CSV": ("csv", "text/csv", write_csv),
+                  "XLSX": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_xlsx)}
+
+def submit_export(kind: str, fmt: str = "CSV", **filters) -> int:
+    return submit_job("export", f"Export {kind} ({fmt})", dict(kind=kind, fmt=fmt, filters=filters))
+
+@job("export")
+def export_job(ctx: JobContext, kind: str, fmt: str, filters: dict) -> dict:
+    ext, mime, write = EXPORT_FORMATS[fmt]
+    total = count_export(kind, **filters)
+    ctx.progress(0, total, force=True)
+    path = job_dir() / f"export-{ctx.id}.{ext}"
+    try:
+        with open(path, "wb") as out:
+            write(kind, out, progress=lambda n: ctx.progress(n, total), **filters)
+    except BaseException:
+        os.remove(path)
+        raise
+    ctx.advance(total, total)
+    return dict(path=str(path), file_name=f"{kind}_export.{ext}", mime=mime, rows=total, bytes=path.stat().st_size)
+
+def submit_bulk_update(changes: dict, ids=None, **filters) -> int:
+    what = ", ".join(f"{k}={v!r}" for k, v in changes.items())
+    return submit_job("bulk_update", f"Bulk update: {what}", dict(changes=changes, ids=ids, filters=filters))
+
+@job("bulk_update")
+def bulk_update_job(ctx: JobContext, changes: dict, ids, filters: dict) -> dict:
+    # one UPDATE statement: no progress in between, and a cancel only lands before it starts
+    ctx.progress(0, len(ids) if ids is not None else count_contacts(**filters), force=True)
+    res = bulk_update_contacts(changes, ids=ids, **filters)
+    ctx.advance(res["matched"], res["matched"])
+    return res
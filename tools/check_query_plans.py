@@ -0,0 +1,63 @@
+"""Flag full table scans and temp B-tree sorts in the queries db.py issues.
+
+    python tools/check_query_plans.py [--db path/to/crm.sqlite3] [-v]
+
+Exits 1 when any probe in db.QUERY_PLAN_PROBES has an unexpected scan, so it can
+gate changes that add or modify queries. Without --db it checks a fresh empty
+database built from SCHEMA_SQL (the planner still picks indexes on empty tables).
+--db only reads the database: it is not migrated (an older schema is refused, run
+tools/migrate.py first) and its journal mode is left as it is.
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+
+
+def use_existing(path: Path) -> int:
+    # -> its schema version; points db at it without init_db(), which would migrate and optimize
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        version = db.schema_version(conn)
+        db.FTS_ENABLED = bool(conn.execute("SELECT 1 FROM sqlite_master WHERE name='contacts_fts'").fetchone())
+    finally:
+        conn.close()
+    db.configure_pool(pragmas={k: v for k, v in db.PRAGMAS.items() if k != "journal_mode"})
+    db.DB_PATH = path
+    return version
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=Path)
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args()
+    if args.db:
+        try:
+            version = use_existing(args.db)
+        except sqlite3.Error as e:
+            sys.exit(f"{args.db}: {e}")
+        if version < db.SCHEMA_VERSION:
+            sys.exit(f"{args.db} is at schema version {version} of {db.SCHEMA_VERSION}; run tools/migrate.py first")
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.db:
+            db.DB_PATH = Path(tmp) / "plans.sqlite3"
+            db.init_db()
+        results = db.check_query_plans()
+        db.close_pools()
+    bad = [r for r in results if r["problems"]]
+    for r in results:
+        if r["problems"] or args.verbose:
+            print(f"{'FAIL' if r['problems'] else 'ok  '} {r['probe']}: {r['sql']}")
+            for detail in r["plan"]:
+                print(f"       {detail}")
+    print(f"{len(results)} queries checked, {len(bad)} with unexpected scans")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Check how an upsert import matches and folds rows, against small hand-written cases.
+
+    python tools/check_upserts.py [-v]
+
+Each case starts from a fresh database holding a few contacts, upserts one batch
+through db.import_chunk and compares the counts and the resulting contacts with
+what matching the rows one at a time (phone key first, then email key) gives.
+Exits 1 when any case differs, so it can gate changes to db.upsert_contacts.
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+
+SHOWN = ("name", "phone", "email", "notes")
+
+# (name, existing contacts, batch rows, expected counts, expected contacts by id as SHOWN tuples)
+CASES = [
+    ("rows sharing an email but matching different contacts by phone",
+     [dict(name="Alice", phone="0821110000"), dict(name="Bob", phone="0822220000")],
+     [dict(name="Alice", phone="082 111 0000", email="family@x.com", notes="a"),
+      dict(name="Bob", phone="082 222 0000", email="family@x.com", notes="b")],
+     dict(inserted=0, updated=2),
+     [("Alice", "082 111 0000", "family@x.com", "a"), ("Bob", "082 222 0000", "family@x.com", "b")]),
+    ("one row matching by phone, one by email, same contact",
+     [dict(name="Thabo", phone="0821111111", email="thabo@x.co")],
+     [dict(name="Thabo A", phone="27821111111", notes="a"),
+      dict(name="Thabo B", phone="0839999999", email="THABO@x.co", notes="b")],
+     dict(inserted=0, updated=2),
+     [("Thabo B", "27821111111", "THABO@x.co", "b")]),
+    ("email-matched row first, phone-matched row second",
+     [dict(name="Thabo", phone="0821111111", email="thabo@x.co")],
+     [dict(name="B", phone="0830000000", email="thabo@x.co"), dict(name="A", phone="0821111111")],
+     dict(inserted=0, updated=2),
+     [("A", "0821111111", "thabo@x.co", "")]),
+    ("new rows sharing a phone key",
+     [],
+     [dict(name="Lindi", phone="0845555555", notes="first"), dict(name="", phone="+27 84 555 5555", email="l@x.co")],
+     dict(inserted=2, updated=0),
+     [("Lindi", "+27 84 555 5555", "l@x.co", "first")]),
+    ("new rows sharing an email, no phone match",
+     [dict(name="Sipho", phone="0861234567")],
+     [dict(name="Zola", phone="0871111111", email="z@x.co"), dict(name="Zola M", phone="0872222222", email="z@x.co")],
+     dict(inserted=2, updated=0),
+     [("Sipho", "0861234567", "", ""), ("Zola M", "0872222222", "z@x.co", "")]),
+    ("phone-matched row keeps its contact apart from a new row with its email",
+     [dict(name="Nomsa", phone="0811234567", email="n@x.co")],
+     [dict(name="Nomsa", phone="0811234567", notes="kept"), dict(name="Other", phone="0819999999", email="other@x.co"),
+      dict(name="Other 2", phone="0818888888", email="n@x.co")],
+     dict(inserted=1, updated=2),
+     [("Other 2", "0811234567", "n@x.co", "kept"), ("Other", "0819999999", "other@x.co", "")]),
+]
+
+
+def run_case(path: Path, existing: list, batch: list):
+    db.DB_PATH = path
+    db.init_db()
+    try:
+        for data in existing:
+            db.insert_contact(data)
+        imp = db.start_import(path.name, path.name, {})
+        res = db.import_chunk(imp["id"], batch, len(batch), upsert=True)
+        shown = ",".join(f"IFNULL({k}, '')" for k in SHOWN)
+        with db.get_conn() as conn:
+            rows = [tuple(r) for r in conn.execute(f"SELECT {shown} FROM contacts ORDER BY id")]
+    finally:
+        db.close_pools()
+    return dict(inserted=res["inserted"], updated=res["updated"]), rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args()
+    bad = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (name, existing, batch, counts, contacts) in enumerate(CASES):
+            got_counts, got = run_case(Path(tmp) / f"case{i}.sqlite3", existing, batch)
+            ok = got_counts == counts and got == contacts
+            bad += not ok
+            if not ok or args.verbose:
+                print(f"{'ok  ' if ok else 'FAIL'} {name}: {got_counts}")
+                for row in got:
+                    print(f"       {row}")
+                if not ok:
+                    print(f"     expected {counts}")
+                    for row in contacts:
+                        print(f"       {row}")
+    print(f"{len(CASES)} cases checked, {bad} failed")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""Bring a CRM database up to the current schema version and report each step's time.
+
+    python tools/migrate.py [--db path/to/crm.sqlite3] [--status]
+
+The app does the same on its first run against a database; this lets a large upgrade
+(e.g. a backfill over every contact) run ahead of time. --status only prints the version.
+"""
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=Path, default=db.DB_PATH)
+    ap.add_argument("--status", action="store_true")
+    args = ap.parse_args()
+    db.DB_PATH = args.db
+    if args.status:
+        conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+        version = db.schema_version(conn)
+        conn.close()
+        print(f"{args.db}: schema version {version} of {db.SCHEMA_VERSION}")
+        return 0 if version >= db.SCHEMA_VERSION else 1
+    ran = db.init_db()
+    db.close_pools()
+    for version, description, seconds in ran:
+        print(f"{version:>3}  {description:<42} {seconds * 1000:>9.1f} ms")
+    print(f"{args.db}: {len(ran)} migration(s) applied, now at version {db.SCHEMA_VERSION}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
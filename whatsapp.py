@@ -0,0 +1,77 @@
+import csv
+import string
+from urllib.parse import quote_plus
+
+import pandas as pd
+
+from db import CONTACT_COLUMNS, iter_export, insert_campaign_batch
+
+# Batch WhatsApp sends: a Contacts filter selects the segment, which is read from the database
+# in chunks; each chunk is rendered column-wise with pandas (template pieces concatenated as
+# whole Series, phone numbers normalized with vectorized string ops) and streamed on to the
+# queue CSV and the activity log without the whole segment ever being in memory.
+TEMPLATE_FIELDS = ["name","phone","interest","status","tags","assigned","action_needed","action_taken","username","password"]
+QUEUE_COLUMNS = ["ContactID","Name","Phone","WhatsApp","Link","Message"]
+
+def compile_template(template: str):
+    # -> render(df) giving the filled-in message for every row of df as a Series.
+    # Parsed once; unknown placeholders fail here rather than on the first contact.
+    pieces = []
+    for literal, field, spec, conv in string.Formatter().parse(template):
+        if field is not None and field not in TEMPLATE_FIELDS:
+            raise ValueError(f"Unknown placeholder {{{field}}}; use one of " + ", ".join(f"{{{f}}}" for f in TEMPLATE_FIELDS))
+        pieces.append((literal, field, spec, conv))
+
+    def render(df: pd.DataFrame) -> pd.Series:
+        out = pd.Series("", index=df.index, dtype=object)
+        for literal, field, spec, conv in pieces:
+            if literal:
+                out = out + literal
+            if field is None:
+                continue
+            col = df[field].fillna("").astype(str)
+            if spec or conv:
+                fmt = "{0" + (f"!{conv}" if conv else "") + (f":{spec}" if spec else "") + "}"
+                col = col.map(fmt.format)
+            out = out + col
+        return out
+    return render
+
+def normalize_phones(phones: pd.Series) -> pd.Series:
+    # vectorized db.normalize_phone: digits only, leading 0 -> 27
+    digits = phones.fillna("").astype(str).str.replace(r"\D", "", regex=True)
+    return digits.where(~digits.str.startswith("0"), "27" + digits.str[1:])
+
+def render_segment(template: str, search: str = "", status: str = "", tag: str = "", chunk_size: int = 5000, tag_mode: str = "all"):
+    # -> DataFrame chunks with contact_id, name, phone, wa_phone, link, message
+    render = compile_template(template)
+    for rows in iter_export("contacts", search=search, status=status, tag=tag, chunk_size=chunk_size, tag_mode=tag_mode):
+        df = pd.DataFrame.from_records(rows, columns=CONTACT_COLUMNS)
+        out = pd.DataFrame({"contact_id": df["id"], "name": df["name"], "phone": df["phone"].fillna("")})
+        out["wa_phone"] = normalize_phones(df["phone"])
+        out["message"] = render(df)
+        out["link"] = "https://wa.me/" + out["wa_phone"] + "?text=" + out["message"].map(quote_plus)
+        yield out
+
+def run_campaign(template: str, campaign: dict, out=None, log: bool = True, **filters) -> dict:
+    # Renders the whole segment once, writing queue rows to out (text file, optional) and, with
+    # log=True, recording the campaigns row and every activity in a single transaction.
+    w = csv.writer(out) if out is not None else None
+    if w:
+        w.writerow(QUEUE_COLUMNS)
+    counted = dict(rendered=0)
+
+    def activities():
+        for chunk in render_segment(template, **filters):
+            counted["rendered"] += len(chunk)
+            if w:
+                w.writerows(chunk[["contact_id","name","phone","wa_phone","link","message"]].itertuples(index=False, name=None))
+            yield from zip(chunk["contact_id"].tolist(), chunk["message"].tolist())
+
+    if log:
+        res = insert_campaign_batch(dict(campaign, message=template), activities())
+    else:
+        for _ in activities():
+            pass
+        res = dict(campaign_id=None, logged=0)
+    return dict(res, rendered=counted["rendered"])